@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Asyncio wrapper for Mippit, so that a single event loop can host many virtual machines at once.
+
+`run` runs a program a slice at a time with `Mippit.run_slice`, letting other tasks run between slices. When the program reads from 0xFFFF0004 and no input has arrived yet, it waits for more input to arrive on an asyncio stream, rather than blocking the whole thread:
+
+    async def handle_session(reader, writer):
+        mips = mippits.Mippit()
+        mips.load(code)
+        await asynchronous.run(mips, reader, writer)
+        writer.close()
+
+    server = await asyncio.start_server(handle_session, "localhost", 8241)
+"""
+
+import sys, getopt, asyncio
+
+import mippits
+
+SLICE_STEPS = 10000 # number of instructions to run before letting other tasks run
+READ_SIZE = 65536 # maximum number of bytes of input to read at a time
+
+async def run(mips, reader, writer = None, max_steps = None, slice_steps = SLICE_STEPS):
+    """
+    Runs the program on `mips` from the current PC until it ends, raises an exception, or executes `max_steps` instructions if `max_steps` is not `None`.
+
+    Returns `mippits.HALTED`, `mippits.FAULTED` (with the exception in `mips.fault`), or `mippits.STEP_LIMIT`.
+
+    The program reads its input from `reader`, which has an async `read(n)` method that returns `b""` at the end of input, like an `asyncio.StreamReader`. If `writer` is not `None`, the program's output is written to it after every slice, and it has a `write(data)` method and an async `drain()` method, like an `asyncio.StreamWriter`. Otherwise, output goes to `mips.output` as usual.
+    """
+    mips.input = mippits.FeedInput()
+    if writer is not None: mips.output = mippits.BytesOutput()
+    start_steps = mips.steps
+    while True:
+        steps = slice_steps if max_steps is None else min(slice_steps, max_steps - (mips.steps - start_steps))
+        status = mips.run_slice(steps)
+        if writer is not None:
+            output = mips.output.take()
+            if output:
+                writer.write(output)
+                await writer.drain()
+        if status == mippits.HALTED or status == mippits.FAULTED: return status
+        if status == mippits.WAITING: # wait for more input, letting other tasks run in the meantime
+            data = await reader.read(READ_SIZE)
+            if data: mips.input.feed(data)
+            else: mips.input.close()
+        elif max_steps is not None and mips.steps - start_steps >= max_steps: return mippits.STEP_LIMIT
+        else: await asyncio.sleep(0) # let other tasks run
+
+async def serve(words, host, port, max_steps = None): # run a fresh copy of the program for every connection to `host`:`port`, using the connection for input and output
+    async def handle_session(reader, writer):
+        mips = mippits.Mippit()
+        mips.load_words(words)
+        try:
+            status = await run(mips, reader, writer, max_steps)
+            if status == mippits.FAULTED: writer.write("\nProgram raised {}: {}\n".format(type(mips.fault).__name__, mips.fault).encode("utf-8"))
+            elif status == mippits.STEP_LIMIT: writer.write("\nProgram stopped after {} steps\n".format(mips.steps).encode("utf-8"))
+            await writer.drain()
+        except ConnectionError: pass # the other end went away
+        finally: writer.close()
+    server = await asyncio.start_server(handle_session, host, port)
+    async with server: await server.serve_forever()
+
+def print_help():
+    print("{} --help".format(sys.argv[0]))
+    print("    Shows this help message.")
+    print()
+    print("{} [--host=address] [--port=n] [--max-steps=n] file".format(sys.argv[0]))
+    print("    Serves `file` over TCP on `address` (defaulting to localhost) and port `n` (defaulting to 8241), running a fresh copy of the program for each connection, which it uses for input and output.")
+    print("    `--max-steps` limits the number of instructions each copy of the program can execute.")
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "host=", "port=", "max-steps="])
+    except getopt.GetoptError as err:
+        print(err)
+        print()
+        print_help()
+        sys.exit(2)
+    host, port, max_steps = "localhost", 8241, None
+    for opt, arg in opts:
+        if opt == "--help":
+            print_help()
+            sys.exit()
+        elif opt == "--host": host = arg
+        elif opt == "--port": port = int(arg)
+        elif opt == "--max-steps": max_steps = int(arg)
+    if len(args) != 1:
+        print_help()
+        sys.exit(2)
+
+    words = mippits.code_to_words(mippits.read_code(args[0]))
+    try: asyncio.run(serve(words, host, port, max_steps))
+    except KeyboardInterrupt: pass
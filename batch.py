@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import sys, getopt, json, time, multiprocessing
+from collections import OrderedDict
+
+import mippits
+
+TIMEOUT = "timeout" # the job ran out of wall-clock time
+ERROR = "error" # the program raised an exception, such as an unknown instruction or a misaligned memory access
+CHUNK_STEPS = 100000 # number of instructions to run between checks of the wall-clock limit
+MAX_MACHINES = 8 # number of loaded virtual machines each worker keeps for reuse, see `machines`
+
+binaries = {} # mapping from binary paths to their code as an `array("I")` (or the exception raised while reading it), shared with the worker processes by `init_worker`
+options = {}
+machines = OrderedDict() # mapping from `(binary, offset)` to a virtual machine with that binary loaded and a snapshot of its state right after loading, reused between jobs in the same worker - only the `MAX_MACHINES` most recently used are kept, since in grading most binaries are only run a few times
+
+def init_worker(shared_binaries, shared_options):
+    binaries.update(shared_binaries)
+    options.update(shared_options)
+
+def run_job(job):
+    """
+    Runs a single job in a virtual machine reset to the state right after loading the binary, and returns the result as a dictionary.
+
+    `job` is a dictionary with the keys `binary` (path of the MIPS binary) and optionally `id`, `registers` (mapping from register numbers to initial values), `stdin` (text to provide as standard input), `stdin_file` (path of a file to provide as standard input), `offset` (address to load the binary at), `max_steps`, and `timeout` (in seconds). Missing step and time limits default to the ones given on the command line.
+
+    Jobs that can't be set up, such as ones with a missing binary or input file or an invalid register, only have the keys `id`, `reason` (`ERROR`), and `error` in their result, and don't affect the other jobs.
+    """
+    result = {"id": job.get("id") if isinstance(job, dict) else None}
+    try: mips, max_steps, timeout = prepare_job(job)
+    except Exception as e:
+        result["reason"] = ERROR
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        return result
+
+    start = time.monotonic()
+    deadline = float("inf") if timeout is None else start + timeout
+    try:
+        while True:
+            chunk = CHUNK_STEPS if max_steps is None else min(CHUNK_STEPS, max_steps - mips.steps)
+            reason = mips.resume(chunk)
+            if reason == mippits.HALTED: break
+            if max_steps is not None and mips.steps >= max_steps: break
+            if time.monotonic() >= deadline:
+                reason = TIMEOUT
+                break
+    except Exception as e:
+        reason = ERROR
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    result["reason"] = reason
+    result["steps"] = mips.steps
+    result["time"] = time.monotonic() - start
+    result["registers"] = list(mips.registers) # copy, since the virtual machine is reused for later jobs
+    result["HI"], result["LO"] = mips.HI, mips.LO
+    result["stdout"] = mips.output.getvalue().decode("latin-1") # one character per byte written
+    return result
+
+def prepare_job(job): # returns `(mips, max_steps, timeout)` for `job`, with `mips` reset to the state right after loading the binary and set up to run the job
+    max_steps, timeout = job.get("max_steps", options["max_steps"]), job.get("timeout", options["timeout"])
+    if "stdin_file" in job:
+        with open(job["stdin_file"], "rb") as f: stdin = f.read()
+    else: stdin = job.get("stdin", "").encode("utf-8")
+    offset = job.get("offset", 0)
+    registers = {int(register): mippits.normalize(value) for register, value in job.get("registers", {}).items()}
+    for register in registers: assert 1 <= register <= 31, "Invalid register: {}".format(register)
+
+    key = (job["binary"], offset)
+    if key not in machines: # first job for this binary in this worker (or since its machine was discarded), load it and save the initial state
+        words = binaries[job["binary"]]
+        if isinstance(words, Exception): raise words # the binary couldn't be read
+        mips = mippits.Mippit()
+        mips.compile_blocks, mips.fusion = options["blocks"], options["fusion"]
+        mips.load_words(words, offset)
+        if options["prebuild"]: # prepare the code before any job is timed, the snapshot keeps it for later jobs
+            import cfg
+            mips.prebuild(cfg.ControlFlowGraph(words, offset))
+        machines[key] = (mips, mips.snapshot())
+        if len(machines) > MAX_MACHINES: machines.popitem(last=False) # discard the least recently used
+    else: machines.move_to_end(key)
+    mips, initial_state = machines[key]
+    mips.restore(initial_state) # much faster than loading the binary again, and keeps any compiled blocks
+    mips.input, mips.output = mippits.BytesInput(stdin), mippits.BytesOutput()
+    for register, value in registers.items(): mips.registers[register] = value
+    mips.PC = offset
+    return mips, max_steps, timeout
+
+def run_jobs(jobs, processes = None, max_steps = None, timeout = None, blocks = False, fusion = False, prebuild = False):
+    """
+    Runs every job in `jobs` (a list of dictionaries, see `run_job`) on a pool of `processes` worker processes, defaulting to one per core.
+
+    Each binary is read and converted to words once, then shared with the workers. If `prebuild` is true, each worker also prepares the code of each binary it loads ahead of time with `Mippit.prebuild`. Yields the results in the same order as `jobs`.
+    """
+    shared_binaries = {}
+    for job in jobs:
+        binary = job.get("binary") if isinstance(job, dict) else None
+        if not isinstance(binary, str) or binary in shared_binaries: continue # jobs without a valid binary fail on their own in `run_job`
+        try: shared_binaries[binary] = mippits.code_to_words(mippits.read_code(binary))
+        except Exception as e: shared_binaries[binary] = e # reported by every job that uses this binary
+    shared_options = {"max_steps": max_steps, "timeout": timeout, "blocks": blocks, "fusion": fusion, "prebuild": prebuild}
+    with multiprocessing.Pool(processes, init_worker, (shared_binaries, shared_options)) as pool:
+        yield from pool.imap(run_job, jobs, chunksize=max(1, min(64, len(jobs) // (4 * (processes or multiprocessing.cpu_count())))))
+
+def print_help():
+    print("{} --help".format(sys.argv[0]))
+    print("    Shows this help message.")
+    print()
+    print("{} [--processes=n] [--max-steps=n] [--timeout=seconds] [--blocks] [--fusion] [--prebuild] [manifest]".format(sys.argv[0]))
+    print("    Runs every job in `manifest` (or standard input), a file with one JSON object per line describing a job, and prints one JSON object per line with the result of each job.")
+    print("    Jobs have the keys `binary`, and optionally `id`, `registers`, `stdin`, `stdin_file`, `offset`, `max_steps`, and `timeout`.")
+    print("    `--processes` sets the number of worker processes, defaulting to the number of cores.")
+    print("    `--max-steps` and `--timeout` set the default limits on instructions executed and wall-clock time for each job.")
+    print("    If `--blocks` is specified, programs are run with the basic block compiler.")
+    print("    If `--fusion` is specified, common instruction sequences are run as single fused instructions.")
+    print("    If `--prebuild` is specified, each worker decodes (and compiles or fuses) the code it can find in each binary when first loading it, before timing any job, rather than as jobs first reach it. The first job's time and timeout are then like the others', but the whole batch takes longer.")
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "processes=", "max-steps=", "timeout=", "blocks", "fusion", "prebuild"])
+    except getopt.GetoptError as err:
+        print(err)
+        print()
+        print_help()
+        sys.exit(2)
+    processes, max_steps, timeout, blocks, fusion, prebuild = None, None, None, False, False, False
+    for opt, arg in opts:
+        if opt == "--help":
+            print_help()
+            sys.exit()
+        elif opt == "--processes": processes = int(arg)
+        elif opt == "--max-steps": max_steps = int(arg)
+        elif opt == "--timeout": timeout = float(arg)
+        elif opt == "--blocks": blocks = True
+        elif opt == "--fusion": fusion = True
+        elif opt == "--prebuild": prebuild = True
+    if len(args) > 1:
+        print_help()
+        sys.exit(2)
+
+    if args:
+        with open(args[0]) as f: jobs = [json.loads(line) for line in f if line.strip()]
+    else: jobs = [json.loads(line) for line in sys.stdin if line.strip()]
+    for result in run_jobs(jobs, processes, max_steps, timeout, blocks, fusion, prebuild):
+        print(json.dumps(result), flush=True)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import sys, os, getopt, json, time, platform, tempfile
+
+import mippits
+
+BENCHMARKS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# mapping from workload names to the steps each one takes and the register values it ends with, used to check the results
+# each workload is in `benchmarks/NAME.mips`, assembled from `benchmarks/NAME.asm`
+WORKLOADS = {
+    "loop": (1200004, {3: 2690788672}), # tight arithmetic loop
+    "fib": (306475, {3: 6765}), # recursive calls through `jalr`/`jr`
+    "array": (312479, {3: 26188800}), # `lw`/`sw` array traffic
+    "muldiv": (650008, {3: 125293}), # `mult`/`div` chains
+    "output": (410007, {5: 0}), # output-heavy MMIO, writing 135000 bytes
+}
+ENGINES = {"interpret": {}, "blocks": {"compile_blocks": True}, "fused": {"fusion": True}} # mapping from engine names to the `Mippit` attributes that enable them
+LOAD_WORDS = 1 << 20 # number of words to load when measuring load time
+DECODE_WORDS = 1 << 18 # number of words to decode when measuring disassembly throughput
+
+def read_workload(name):
+    with open(os.path.join(BENCHMARKS_DIRECTORY, name + ".mips"), "rb") as f: return f.read()
+
+def best_time(function, repeat): # shortest time taken by `function()` over `repeat` calls
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_workload(name, engine, repeat):
+    """
+    Returns the result of running the workload `name` with the engine `engine`, taking the best time out of `repeat` runs.
+
+    Each run starts from a freshly loaded virtual machine, and its final state is checked against `WORKLOADS`.
+    """
+    code = read_workload(name)
+    expected_steps, expected_registers = WORKLOADS[name]
+    best = float("inf")
+    for _ in range(repeat):
+        mips = mippits.Mippit()
+        mips.load(code)
+        for attribute, value in ENGINES[engine].items(): setattr(mips, attribute, value)
+        mips.input, mips.output = mippits.BytesInput(b""), mippits.BytesOutput()
+        start = time.perf_counter()
+        mips.run()
+        best = min(best, time.perf_counter() - start)
+        assert mips.steps == expected_steps, "Workload {} with engine {} executed {} instructions, expected {}".format(name, engine, mips.steps, expected_steps)
+        for register, value in expected_registers.items():
+            assert mips.registers[register] == value, "Workload {} with engine {} set ${} to {}, expected {}".format(name, engine, register, mips.registers[register], value)
+    return {"count": mips.steps, "unit": "instructions", "seconds": best, "rate": mips.steps / best}
+
+def measure_load(repeat): # results for loading a large image with `load`, `load_hex`, and `load_file`
+    code = b"".join(read_workload(name) for name in sorted(WORKLOADS))
+    code = (code * (LOAD_WORDS // (len(code) // 4) + 1))[:LOAD_WORDS * 4]
+    hex_code = code.hex()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "image.mips")
+        with open(path, "wb") as f: f.write(code)
+        loaders = (
+            ("load/binary", lambda: mippits.Mippit().load(code)),
+            ("load/hex", lambda: mippits.Mippit().load_hex(hex_code)),
+            ("load/file", lambda: mippits.Mippit().load_file(path)),
+        )
+        for name, load in loaders:
+            seconds = best_time(load, repeat)
+            results[name] = {"count": LOAD_WORDS, "unit": "words", "seconds": seconds, "rate": LOAD_WORDS / seconds}
+    return results
+
+def measure_decode(repeat): # results for disassembling the workloads word by word with `decode`
+    words = [word for name in sorted(WORKLOADS) for word in mippits.code_to_words(read_workload(name))]
+    words = (words * (DECODE_WORDS // len(words) + 1))[:DECODE_WORDS]
+    def decode_all():
+        for word in words: mippits.decode(word)
+    seconds = best_time(decode_all, repeat)
+    return {"decode": {"count": DECODE_WORDS, "unit": "words", "seconds": seconds, "rate": DECODE_WORDS / seconds}}
+
+def run_benchmarks(repeat = 3, selected = None):
+    """
+    Runs every benchmark whose name starts with one of the prefixes in `selected` (or every benchmark if `selected` is `None`), and returns the results as a dictionary for JSON output.
+
+    Workload benchmarks are named `WORKLOAD/ENGINE`, such as `loop/interpret`. Each result has the number of things done (`count`, in `unit`), the best time in `seconds`, and the `rate` in units per second.
+    """
+    results = {}
+    def wanted(name): return selected is None or any(name.startswith(prefix) for prefix in selected)
+    for name in WORKLOADS:
+        for engine in ENGINES:
+            if wanted(name + "/" + engine): results[name + "/" + engine] = run_workload(name, engine, repeat)
+    if wanted("load/"): results.update((name, result) for name, result in measure_load(repeat).items() if wanted(name))
+    if wanted("decode"): results.update(measure_decode(repeat))
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(), "repeat": repeat, "results": results}
+
+def compare(results, baseline, tolerance):
+    """
+    Compares `results` against `baseline` (both in the format returned by `run_benchmarks`), and returns a list of `(name, baseline rate, rate, change, regressed)` for each benchmark in both.
+
+    `change` is the relative change in rate, and `regressed` is whether it is below `-tolerance`.
+    """
+    comparison = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]: continue
+        old_rate = baseline["results"][name]["rate"]
+        change = result["rate"] / old_rate - 1
+        comparison.append((name, old_rate, result["rate"], change, change < -tolerance))
+    return comparison
+
+def print_help():
+    print("{} --help".format(sys.argv[0]))
+    print("    Shows this help message.")
+    print()
+    print("{} [--repeat=n] [--output=results_file] [--baseline=baseline_file] [--tolerance=fraction] [benchmark_1 ... benchmark_n]".format(sys.argv[0]))
+    print("    Runs the benchmarks and prints a summary to standard error, and the results as JSON to standard output or `results_file`.")
+    print("    Benchmarks are `WORKLOAD/ENGINE` (workloads are {}, engines are {}), `load/binary`, `load/hex`, `load/file`, and `decode`. If any are specified, only benchmarks starting with them are run.".format(", ".join(WORKLOADS), ", ".join(ENGINES)))
+    print("    Each benchmark is run `n` times (defaulting to 3) and the best time is used.")
+    print("    If `--baseline` is specified, the results are compared against `baseline_file` from an earlier run, exiting with status 1 if any benchmark is slower by more than `fraction` (defaulting to 0.1).")
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "repeat=", "output=", "baseline=", "tolerance="])
+    except getopt.GetoptError as err:
+        print(err)
+        print()
+        print_help()
+        sys.exit(2)
+    repeat, output_path, baseline_path, tolerance = 3, None, None, 0.1
+    for opt, arg in opts:
+        if opt == "--help":
+            print_help()
+            sys.exit()
+        elif opt == "--repeat": repeat = int(arg)
+        elif opt == "--output": output_path = arg
+        elif opt == "--baseline": baseline_path = arg
+        elif opt == "--tolerance": tolerance = float(arg)
+
+    results = run_benchmarks(repeat, args or None)
+    for name, result in results["results"].items():
+        print("{:<20} {:>14,.0f} {}/s  ({} in {:.4f}s)".format(name, result["rate"], result["unit"], result["count"], result["seconds"]), file=sys.stderr)
+    if output_path is not None:
+        with open(output_path, "w") as f: json.dump(results, f, indent=4)
+    else: print(json.dumps(results, indent=4))
+
+    if baseline_path is not None:
+        with open(baseline_path) as f: baseline = json.load(f)
+        regressions = 0
+        print(file=sys.stderr)
+        for name, old_rate, rate, change, regressed in compare(results, baseline, tolerance):
+            regressions += regressed
+            print("{:<20} {:>14,.0f} -> {:>14,.0f} {:+7.1%}{}".format(name, old_rate, rate, change, "  REGRESSION" if regressed else ""), file=sys.stderr)
+        if regressions:
+            print("{} benchmark(s) regressed by more than {:.0%}".format(regressions, tolerance), file=sys.stderr)
+            sys.exit(1)
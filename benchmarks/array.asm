@@ -0,0 +1,32 @@
+; lw/sw array traffic: fills an array of 1024 words at 0x10000 with 0 to 1023, then 50 times stores its running sums into a second array at 0x12000, leaving the total in $3
+lis $4
+.word 0x10000
+lis $5
+.word 4096
+lis $6
+.word 4
+lis $7
+.word 50
+lis $8
+.word 1
+add $9, $0, $0
+add $10, $0, $0
+fill:
+add $11, $4, $9
+sw $10, 0($11)
+add $10, $10, $8
+add $9, $9, $6
+bne $9, $5, fill
+add $3, $0, $0
+repeat:
+add $9, $0, $0
+sum:
+add $11, $4, $9
+lw $12, 0($11)
+add $3, $3, $12
+sw $3, 8192($11)
+add $9, $9, $6
+bne $9, $5, sum
+sub $7, $7, $8
+bne $7, $0, repeat
+jr $31
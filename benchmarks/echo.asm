@@ -0,0 +1,14 @@
+; interactive echo: copies standard input to standard output until the end of input, for trying out `asynchronous.py`
+lis $5
+.word 0xFFFF0004
+lis $6
+.word 0xFFFF000C
+lis $7
+.word -1
+loop:
+lw $1, 0($5)
+beq $1, $7, done
+sw $1, 0($6)
+beq $0, $0, loop
+done:
+jr $31
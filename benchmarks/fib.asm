@@ -0,0 +1,51 @@
+; recursive calls through jalr/jr: sets $3 to the 20th Fibonacci number
+sw $31, -4($30)
+lis $31
+.word 4
+sub $30, $30, $31
+lis $1
+.word 20
+lis $8
+.word fib
+jalr $8
+lis $31
+.word 4
+add $30, $30, $31
+lw $31, -4($30)
+jr $31
+
+; sets $3 to the $1th Fibonacci number
+fib:
+lis $9
+.word 2
+slt $10, $1, $9
+beq $10, $0, recurse
+add $3, $1, $0
+jr $31
+recurse:
+sw $31, -4($30)
+sw $1, -8($30)
+lis $9
+.word 12
+sub $30, $30, $9
+lis $9
+.word 1
+sub $1, $1, $9
+lis $8
+.word fib
+jalr $8
+sw $3, 0($30)
+lis $9
+.word 1
+sub $1, $1, $9
+lis $8
+.word fib
+jalr $8
+lw $9, 0($30)
+add $3, $3, $9
+lis $9
+.word 12
+add $30, $30, $9
+lw $31, -4($30)
+lw $1, -8($30)
+jr $31
@@ -0,0 +1,11 @@
+; tight arithmetic loop: sets $3 to 1 + 2 + ... + 400000
+lis $4
+.word 400000
+lis $5
+.word 1
+add $3, $0, $0
+loop:
+add $3, $3, $4
+sub $4, $4, $5
+bne $4, $0, loop
+jr $31
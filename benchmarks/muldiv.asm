@@ -0,0 +1,29 @@
+; mult/div chains: runs a linear congruential generator in $1 50000 times, accumulating remainders and quotients into $3
+lis $4
+.word 50000
+lis $5
+.word 1103515245
+lis $6
+.word 12345
+lis $7
+.word 7
+lis $8
+.word 1
+lis $1
+.word 42
+add $3, $0, $0
+loop:
+multu $1, $5
+mflo $1
+add $1, $1, $6
+divu $1, $7
+mfhi $9
+add $3, $3, $9
+mult $1, $9
+mfhi $10
+div $1, $5
+mflo $11
+add $3, $3, $11
+sub $4, $4, $8
+bne $4, $0, loop
+jr $31
@@ -0,0 +1,23 @@
+; output-heavy MMIO: writes 5000 lines of "abcdefghijklmnopqrstuvwxyz" to standard output
+lis $4
+.word 0xFFFF000C
+lis $5
+.word 5000
+lis $6
+.word 1
+lis $7
+.word 97
+lis $8
+.word 123
+lis $9
+.word 10
+line:
+add $10, $7, $0
+char:
+sw $10, 0($4)
+add $10, $10, $6
+bne $10, $8, char
+sw $9, 0($4)
+sub $5, $5, $6
+bne $5, $0, line
+jr $31
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""
+Basic block compiler for Mippit.
+
+Straight-line runs of instructions ending at a `beq`, `bne`, `jr`, or `jalr` are translated into Python functions that keep the registers in local variables, then compiled once with `compile()` and cached in `Mippit.blocks` by their start address, along with their length. Each block function takes the virtual machine and its register list, runs the whole block, and returns the address of the next block to execute.
+
+The results are identical to executing the same instructions one at a time with `Mippit.decode_execute`. If an instruction raises an exception, the registers and PC are left exactly as the interpreter would have left them. Blocks are discarded by `Mippit.invalidate` when any word they were compiled from is modified, and a block that stores into compiled code exits right after the store, so that self-modifying code sees the new instructions.
+
+To use it, set `compile_blocks` on a `Mippit` before calling `run`:
+
+    mips = mippits.Mippit()
+    mips.load(code)
+    mips.compile_blocks = True
+    mips.run()
+"""
+
+import mippits
+from mippits import normalize, signed, classify, PAGE_BITS, PAGE_MASK
+
+MAX_BLOCK_LENGTH = 256 # maximum number of instructions in a single block, to bound compilation time for long straight-line runs
+
+def reg(x): return "0" if x == 0 else "r{}".format(x) # expression that reads register $x - the 0 register is always 0 when read
+def dest(x): return "r{}".format(x) # variable that is assigned to when writing register $x
+
+def translate(mips, start):
+    """
+    Translates the block starting at address `start` into Python source code for a block function.
+
+    Returns the source code, the word indices the block was compiled from, a mapping from the address of each instruction to the number of instructions before it in the block, and the number of instructions in the block.
+    """
+    body, words, executed = [], [], {}
+    used, written = set(), set() # registers the block accesses and registers the block modifies, not including the 0 register
+    memory_accessed = False
+    pc, last_written = start, None
+
+    def exit_block(next_pc, indent = "        "): # write back modified registers and leave the block after the instruction at `offset`, going to `next_pc`
+        lines = ["{}r[{}] = r{}".format(indent, x, x) for x in sorted(written)]
+        lines.append("{}vm.offset = {:#010x}".format(indent, offset)) # like the interpreter, so that a fault at `next_pc` reports the jump that led there
+        lines.append("{}r[0] = {}".format(indent, "r0" if last_written == 0 else "0")) # writes to the 0 register are only visible until the next instruction resets it
+        lines.append("{}return {}".format(indent, next_pc))
+        return lines
+
+    for count in range(1, MAX_BLOCK_LENGTH + 1):
+        index = pc // 4
+        words.append(index)
+        executed[pc] = count - 1
+        offset = pc
+        instruction = mips.MEM[index]
+        name, a, b, c = classify(instruction)
+        next_pc = normalize(pc + 4)
+        body.append("        pc = {:#010x} # {}".format(pc, name or "unknown"))
+        last_written = None
+        if name in ("add", "sub", "slt", "sltu"):
+            d, s, t = a, b, c
+            used.update(x for x in (d, s, t) if x != 0)
+            if d != 0: written.add(d)
+            if name == "add": body.append("        {} = ({} + {}) & 0xFFFFFFFF".format(dest(d), reg(s), reg(t)))
+            elif name == "sub": body.append("        {} = ({} - {}) & 0xFFFFFFFF".format(dest(d), reg(s), reg(t)))
+            elif name == "slt": body.append("        {} = 1 if signed({}) < signed({}) else 0".format(dest(d), reg(s), reg(t)))
+            else: body.append("        {} = 1 if {} < {} else 0".format(dest(d), reg(s), reg(t)))
+            last_written = d
+        elif name in ("mult", "multu", "div", "divu"):
+            s, t = b, c
+            used.update(x for x in (s, t) if x != 0)
+            if name == "mult":
+                body.append("        result = signed({}) * signed({})".format(reg(s), reg(t)))
+                body.append("        vm.HI, vm.LO = normalize(result >> 32), normalize(result)")
+            elif name == "multu":
+                body.append("        result = {} * {}".format(reg(s), reg(t)))
+                body.append("        vm.HI, vm.LO = normalize(result >> 32), normalize(result)")
+            elif name == "div":
+                body.append("        vm.HI, vm.LO = normalize(signed({0}) % signed({1})), normalize(signed({0}) // signed({1}))".format(reg(s), reg(t)))
+            else:
+                body.append("        vm.HI, vm.LO = {0} % {1}, {0} // {1}".format(reg(s), reg(t)))
+        elif name in ("mfhi", "mflo"):
+            d = a
+            if d != 0: used.add(d); written.add(d)
+            body.append("        {} = vm.{}".format(dest(d), "HI" if name == "mfhi" else "LO"))
+            last_written = d
+        elif name == "lis": # the immediate is the next word, which becomes part of the block
+            d = a
+            if d != 0: used.add(d); written.add(d)
+            words.append(next_pc // 4)
+            body.append("        {} = {!r}".format(dest(d), mips.MEM[next_pc // 4]))
+            next_pc = normalize(next_pc + 4)
+            last_written = d
+        elif name == "lw":
+            s, t, i = a, b, c
+            used.update(x for x in (s, t) if x != 0)
+            if t != 0: written.add(t)
+            memory_accessed = True
+            body.append("        address = ({} + {}) & 0xFFFFFFFF".format(reg(s), i))
+            body.append("        assert address % 4 == 0")
+            body.append("        if address == 0xFFFF0004: # read from stdin")
+            body.append("            if vm.input.interactive: vm.output.flush() # show any prompt before waiting for input")
+            body.append("            {} = vm.input.read()".format(dest(t)))
+            body.append("        else:")
+            body.append("            address >>= 2")
+            body.append("            page = pages.get(address >> {})".format(PAGE_BITS))
+            body.append("            {} = page[address & {}] if page is not None else 0".format(dest(t), PAGE_MASK))
+            last_written = t
+        elif name == "sw":
+            s, t, i = a, b, c
+            used.update(x for x in (s, t) if x != 0)
+            memory_accessed = True
+            body.append("        address = ({} + {}) & 0xFFFFFFFF".format(reg(s), i))
+            body.append("        assert address % 4 == 0, \"Invalid address - not aligned to word boundary.\"")
+            body.append("        if address == 0xFFFF000C: vm.output.write({}) # write to stdout".format(reg(t)))
+            body.append("        else:")
+            body.append("            address >>= 2")
+            body.append("            page = writable.get(address >> {})".format(PAGE_BITS))
+            body.append("            if page is None: page = vm.MEM.writable_page(address >> {})".format(PAGE_BITS))
+            body.append("            page[address & {}] = {} & 0xFFFFFFFF".format(PAGE_MASK, reg(t)))
+            body.append("            if address in decoded: # self-modifying code, stop here in case this block was modified")
+            body.append("                vm.invalidate(address)")
+            body.append("                vm.steps -= LENGTH - {} # the rest of the block was not executed".format(count))
+            body.extend(exit_block("{:#010x}".format(next_pc), "                "))
+        elif name in ("beq", "bne"):
+            s, t, i = a, b, c
+            used.update(x for x in (s, t) if x != 0)
+            body.extend(exit_block("{:#010x} if {} {} {} else {:#010x}".format(normalize(next_pc + i * 4), reg(s), "==" if name == "beq" else "!=", reg(t), next_pc)))
+            break
+        elif name == "jr":
+            s = b
+            if s != 0: used.add(s)
+            body.extend(exit_block(reg(s)))
+            break
+        elif name == "jalr":
+            s = b
+            used.update(x for x in (s, 31) if x != 0)
+            written.add(31)
+            body.append("        target = {}".format(reg(s)))
+            body.append("        r31 = {:#010x}".format(next_pc))
+            body.extend(exit_block("target"))
+            break
+        else: # unknown instruction, raise the same error the interpreter would
+            body.append("        raise ValueError({!r})".format("Unknown instruction: {:=#010x}".format(normalize(instruction))))
+            break
+        pc = next_pc
+    else: # block is too long, continue in a new block
+        body.extend(exit_block("{:#010x}".format(pc)))
+
+    source = ["def block(vm, r):"]
+    source.extend("    r{0} = r[{0}]".format(x) for x in sorted(used))
+    if memory_accessed: source.append("    pages, writable, decoded = vm.MEM.pages, vm.MEM.writable, vm.decoded")
+    source.append("    pc = {:#010x}".format(start))
+    source.append("    try:")
+    source.extend(body)
+    source.append("    except BaseException: # leave the registers and PC as they would be if the interpreter had raised this exception")
+    source.extend("        r[{0}] = r{0}".format(x) for x in sorted(written))
+    source.append("        r[0] = 0")
+    source.append("        vm.offset, vm.PC = pc, (pc + 4) & 0xFFFFFFFF")
+    source.append("        vm.steps -= LENGTH - EXECUTED[pc] # the faulting instruction and the rest of the block were not executed")
+    source.append("        raise")
+    return "\n".join(source) + "\n", words, executed, count
+
+def compile_block(mips, start): # compile the block starting at address `start` and add it to the block cache
+    source, words, executed, length = translate(mips, start)
+    namespace = {"normalize": normalize, "signed": signed, "LENGTH": length, "EXECUTED": executed}
+    exec(compile(source, "<block {:=#010x}>".format(start), "exec"), namespace)
+    block = namespace["block"]
+
+    for index in words:
+        if index not in mips.decoded: mips.predecode(index) # stores to predecoded words are checked for self-modifying code
+        mips.block_words.setdefault(index, set()).add(start)
+    mips.blocks[start] = (block, length)
+    return block, length
+
+def run(mips, max_steps = None): # same as `Mippit.resume`, but runs one block at a time
+    registers, blocks = mips.registers, mips.blocks
+    limit = float("inf") if max_steps is None else max_steps
+    PC, start_steps, steps = mips.PC, mips.steps, 0
+    try:
+        while PC != 0xFFFFFFFF: # stop when we jump past end of memory
+            if steps >= limit: break # out of steps, before looking at the next instruction at all, like the interpreter
+            assert PC % 4 == 0, "Program counter must be aligned to word boundaries"
+            block, length = blocks[PC] if PC in blocks else compile_block(mips, PC)
+            if steps + length > limit: break # not enough steps left for the whole block
+            steps += length # blocks that stop early subtract the instructions they didn't execute from `mips.steps`
+            PC = mips.PC = block(mips, registers)
+    finally: mips.steps += steps
+    if PC == 0xFFFFFFFF: return mippits.HALTED
+    return mips.interpret(max_steps - (mips.steps - start_steps)) # use the interpreter for the steps that are left
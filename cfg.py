@@ -0,0 +1,138 @@
+"""
+Static control flow graph for Mippit.
+
+`ControlFlowGraph` finds the instructions in an image that can be reached from its entry point, without running it. It follows `beq` and `bne` branches, and `jr` and `jalr` jumps to registers that were loaded using `lis` earlier on in the same straight-line run of instructions, like CS241 compilers do for calls. Reachable instructions are split into basic blocks, the literal words of `lis` instructions are told apart from instructions, and every other word is treated as data. Addresses that are branched or jumped to get labels, so that the image can be disassembled into readable assembly:
+
+    graph = cfg.ControlFlowGraph(mippits.code_to_words(code))
+    for address, line in zip(range(0, len(code), 4), graph.disassemble()):
+        if address in graph.labels: print(graph.labels[address] + ":")
+        print(line)
+
+Execution engines can use the basic blocks to do their work ahead of time rather than when each block is first reached, see `Mippit.prebuild`.
+
+Jumps to registers that weren't loaded using `lis`, like the `jr $31` at the end of a function, can't be followed. Code that is only reached that way is treated as data.
+"""
+
+import mippits
+from mippits import normalize, signed, classify
+
+class ControlFlowGraph:
+    def __init__(self, words, offset = 0, entries = None):
+        """
+        Builds the control flow graph for the image `words` (a sequence of 32-bit words) loaded at address `offset`, starting from the addresses in `entries`, which defaults to just `offset`.
+        """
+        self.words, self.offset = words, offset
+        self.end = offset + len(words) * 4 # address just after the image
+        self.instructions = set() # addresses of reachable instructions
+        self.literals = set() # addresses of the literal words of reachable `lis` instructions
+        self.pointers = set() # addresses of literal words that were used as the target of a `jr` or `jalr`
+        self.targets = {} # mapping from addresses of `jr` and `jalr` instructions to the set of addresses they were found to jump to
+        self.functions = set() # addresses that `jalr` instructions call
+        self.successors = {} # mapping from addresses of `beq`, `bne`, `jr`, and `jalr` instructions to a tuple of the addresses that can run next, including the return address of `jalr`
+        self.leaders = set() # addresses that start a basic block
+        self.classified = {} # mapping from words to `classify` results, since the same words appear over and over in compiler output
+        self.explore([offset] if entries is None else entries)
+
+        self.blocks = {} # mapping from addresses that start a basic block to `(end, successors)`, where `end` is the address of the last instruction in the block
+        classify = self.classify
+        for start in sorted(self.leaders & self.instructions):
+            pc = start
+            while True:
+                name = classify(pc)[0]
+                next_pc = pc + 8 if name == "lis" else pc + 4 # skip over the literal word of `lis`
+                if name in ("beq", "bne", "jr", "jalr"): successors = self.successors[pc]
+                elif name is None or next_pc not in self.instructions: successors = () # unknown instruction, or running off the end of the reachable code
+                elif next_pc in self.leaders: successors = (next_pc,)
+                else:
+                    pc = next_pc
+                    continue
+                break
+            self.blocks[start] = (pc, successors)
+
+        self.labels = {} # mapping from addresses that are branched or jumped to, to the names of their labels
+        for pc, successors in self.successors.items():
+            for target in successors:
+                if target in self.instructions and target != pc + 4: # return addresses and fall-through successors don't need labels
+                    self.labels[target] = ("F{:08X}" if target in self.functions else "L{:08X}").format(target)
+
+    def classify(self, address): # `classify` result for the word at `address`
+        word = self.words[(address - self.offset) >> 2]
+        result = self.classified.get(word)
+        if result is None: result = self.classified[word] = classify(word)
+        return result
+
+    def explore(self, entries): # find the reachable instructions, following every branch and jump that can be resolved
+        words, offset, end, instructions, classified = self.words, self.offset, self.end, self.instructions, self.classified
+        pending = [address for address in entries if offset <= address < end and address % 4 == 0]
+        self.leaders.update(pending)
+        while pending:
+            pc = pending.pop()
+            constants = {} # mapping from registers to `(value, literal address)` for the registers with known values, where the literal address is that of the `lis` literal they came from, or `None`
+            while offset <= pc < end:
+                if pc in instructions and not constants: break # already explored, and there are no known values that might resolve jumps further on
+                word = words[(pc - offset) >> 2]
+                name, a, b, c = classified[word] if word in classified else self.classify(pc)
+                instructions.add(pc)
+                next_pc = pc + 4
+                if name == "lis":
+                    if next_pc >= end: break # the literal word is past the end of the image
+                    self.literals.add(next_pc)
+                    if a != 0: constants[a] = (words[(next_pc - offset) >> 2], next_pc)
+                    next_pc += 4
+                elif name in ("add", "sub"): # track copies and simple arithmetic, like `add $5, $3, $0`
+                    if a != 0:
+                        if (b == 0 or b in constants) and (c == 0 or c in constants):
+                            s, s_literal = constants[b] if b != 0 else (0, None)
+                            t, t_literal = constants[c] if c != 0 else (0, None)
+                            literal = s_literal if c == 0 else t_literal if b == 0 and name == "add" else None # copies still come from the same literal
+                            constants[a] = (normalize(s + t if name == "add" else s - t), literal)
+                        else: constants.pop(a, None)
+                elif name in ("slt", "sltu", "mfhi", "mflo"): constants.pop(a, None)
+                elif name == "lw": constants.pop(b, None)
+                elif name in ("beq", "bne"):
+                    target = normalize(next_pc + c * 4)
+                    if a == b: successors = (target,) if name == "beq" else (next_pc,) # always or never taken
+                    else: successors = (target, next_pc)
+                    self.add_successors(pc, successors, pending)
+                    break
+                elif name in ("jr", "jalr"):
+                    target, literal = constants.get(b, (None, None)) if b != 0 else (0, None)
+                    successors = ()
+                    if target is not None:
+                        self.targets.setdefault(pc, set()).add(target)
+                        if literal is not None: self.pointers.add(literal)
+                        if name == "jalr": self.functions.add(target)
+                        successors = (target,)
+                    if name == "jalr": successors += (next_pc,) # the call returns here
+                    self.add_successors(pc, successors, pending)
+                    break
+                elif name is None: break # unknown instruction, which raises an exception
+                pc = next_pc
+
+    def add_successors(self, pc, successors, pending): # record that `successors` can run after the instruction at `pc`, exploring any new ones
+        if pc in self.successors: successors = tuple(dict.fromkeys(self.successors[pc] + successors)) # keep targets found with other constants, without duplicates
+        self.successors[pc] = successors
+        for target in successors:
+            if self.offset <= target < self.end and target % 4 == 0:
+                self.leaders.add(target)
+                if target not in self.instructions: pending.append(target)
+
+    def disassemble(self):
+        """
+        Returns a list with the assembly for each word in the image, not including labels.
+
+        Branches to labelled addresses and literal words that are jumped to use the labels, and words that are never executed are shown as hexadecimal `.word` data. Labels are absolute addresses, so literal words only use labels if the image is loaded at address 0, where label values and addresses are the same.
+        """
+        lines, decoded = [], {}
+        for address in range(self.offset, self.end, 4):
+            word = self.words[(address - self.offset) >> 2]
+            if address in self.instructions:
+                name, a, b, c = self.classify(address)
+                target = normalize(address + 4 + c * 4) if name in ("beq", "bne") else None
+                if target in self.labels: lines.append("{} ${}, ${}, {}".format(name, a, b, self.labels[target]))
+                else: lines.append(decoded[word] if word in decoded else decoded.setdefault(word, mippits.decode(word)))
+            elif address in self.literals:
+                if address in self.pointers and self.offset == 0 and word in self.labels: lines.append(".word " + self.labels[word])
+                else: lines.append(".word {}".format(signed(word)))
+            else: lines.append(".word {:=#010x}".format(word))
+        return lines
@@ -3,8 +3,26 @@
 import sys, getopt
 
 import mippits
+import replay
+
+def print_watch_hit(): # describe the memory access that triggered the last watchpoint
+    address, access = mips.watch_hit
+    print("[DEBUGGER] Instruction at {:=#010x} {} watched memory at {:=#010x}".format(mips.offset, "read" if access == "r" else "wrote", address))
+
+def run_until(breakpoints, watchpoints, max_steps = None): # same as `Mippit.run_until`, but taking checkpoints if recording
+    if recording is None: return mips.run_until(breakpoints, watchpoints, max_steps)
+    return recording.run_until(mips, breakpoints, watchpoints, max_steps)
+
+def changed_by_hand(): # the state was changed by the user, so anything recorded after it no longer applies
+    if recording is not None: recording.branch(mips)
 
 def breakpoint_prompt():
+    """
+    Prompts for debugger commands until the user continues the program.
+
+    Returns a set of addresses to stop at just this once, in addition to the breakpoints.
+    """
+    mips.output.flush() # show any output the program produced before the prompt
     print("[DEBUGGER] Program hit breakpoint at {:=#010x}".format(mips.PC))
     while True:
         try: values = input("[DEBUGGER] Enter a debugger command (or \"help\" for options): ").strip().split(maxsplit=1)
@@ -16,17 +34,21 @@ def breakpoint_prompt():
             print("q/quit          - stop debugging and exit")
             print("h/help          - show this help text")
             print("b [address]     - toggle breakpoint at current location, or optionally, at a specified address")
+            print("watch start[ end] [r|w|rw] - toggle watchpoint on reads and/or writes of memory between the specified addresses (defaulting to both)")
             print("c               - continue executing program")
             print("n               - run until just before the next physical instruction, then break")
             print("s               - run until just before the next instruction, then break")
+            print("rs [count]      - go back to just before the last instruction, or the last `count` instructions (needs `--record`)")
+            print("rc              - go back to the last breakpoint or watchpoint the program stopped at (needs `--record`)")
             print("p [start[ end]] - print out register values and optionally, memory values between the specified address or addresses")
             print("w start         - set memory to values prompted from user starting from `start`")
             print("r reg value     - set register $`reg` to `value`")
             print("t               - toggle instruction tracing")
+            print("save            - save the state of the registers and memory")
+            print("restore         - go back to the last saved state of the registers and memory")
         elif command == "b":
-            if not param: param = mips.PC
             try:
-                location = int(param, 0) // 4
+                location = int(param, 0) if param else mips.PC
                 if location in breakpoints:
                     breakpoints.remove(location)
                     print("[DEBUGGER] Breakpoint removed from {:=#010x}".format(location))
@@ -36,18 +58,33 @@ def breakpoint_prompt():
             except ValueError: print("Invalid address: {}".format(param))
         elif command == "c": # continue executing program
             print("[DEBUGGER] Execution continuing from {:=#010x}".format(mips.PC))
-            break
+            return set()
         elif command == "n": # step over (execute until the next instruction in memory)
-            instruction = self.MEM[self.PC // 4] if self.PC // 4 in self.MEM else 0
-            if mippits.decode(instruction).startswith("lis "): # load immediate and skip instruction, make sure to jump over the word
-                location = mips.PC + 8
+            if mippits.classify(mips.MEM[mips.PC // 4])[0] == "lis": # load immediate and skip instruction, make sure to jump over the word
+                location = mippits.normalize(mips.PC + 8)
             else:
-                location = mips.PC + 4
-            breakpoints.add(location) # add a breakpoint at the next instruction in memory
+                location = mippits.normalize(mips.PC + 4)
             print("[DEBUGGER] Stepping over, breaking again at {:=#010x}".format(location))
-            break
+            return {location} # stop at the next instruction in memory, without adding a breakpoint there
         elif command == "s": # step into (execute one instruction)
-            if not mips.step(): break
+            reason = run_until((), watchpoints, 1)
+            if reason == mippits.HALTED: return set()
+            if reason == mippits.WATCHPOINT: print_watch_hit()
+            print("[DEBUGGER] Stepped to {:=#010x}".format(mips.PC))
+        elif command == "rs": # reverse step (go back one or more instructions)
+            if recording is None: print("[DEBUGGER] Going back needs recording, use `--record`")
+            else:
+                try:
+                    if not recording.reverse_step(mips, int(param) if param else 1): print("[DEBUGGER] Reached the start of the recording")
+                    print("[DEBUGGER] Stepped back to {:=#010x} after {} instructions".format(mips.PC, mips.steps))
+                except ValueError: print("[DEBUGGER] Invalid count: {}".format(param))
+        elif command == "rc": # reverse continue (go back to the last breakpoint or watchpoint)
+            if recording is None: print("[DEBUGGER] Going back needs recording, use `--record`")
+            else:
+                reason = recording.reverse_continue(mips, breakpoints, watchpoints)
+                if reason is None: print("[DEBUGGER] Reached the start of the recording")
+                elif reason == mippits.WATCHPOINT: print_watch_hit()
+                print("[DEBUGGER] Went back to {:=#010x} after {} instructions".format(mips.PC, mips.steps))
         elif command == "p": # print
             print(" $1 = {:<25}  $2 = {:<25}  $3 = {:<25}  $4 = {:<20}".format(
                 "{0:=#010x} ({0})".format(mips.registers[1]), "{0:=#010x} ({0})".format(mips.registers[2]),
@@ -90,34 +127,54 @@ def breakpoint_prompt():
                 except ValueError:
                     print("[DEBUGGER] Invalid address bounds: {}".format(param))
                 else:
-                    for location in range(start, end):
-                        print("{0:=#010x} = {1:=#010x} ({1})".format(location * 4, mips.MEM[location] if location in mips.MEM else 0))
+                    for location, value in enumerate(mips.MEM.read_words(start, end - start), start):
+                        print("{0:=#010x} = {1:=#010x} ({1})".format(location * 4, value))
         elif command == "w":
             try:
                 location = int(param, 0) // 4
             except ValueError:
                 print("[DEBUGGER] Invalid start address: {}".format(param))
             else:
+                values = []
                 while True:
-                    entry = input("[DEBUGGER] Enter a value for memory at {:=#010x} (blank to end): ".format(location * 4))
+                    entry = input("[DEBUGGER] Enter a value for memory at {:=#010x} (blank to end): ".format((location + len(values)) * 4))
                     try:
                         value = mippits.normalize(int(entry, 0))
                     except ValueError:
                         if entry.strip() == "": break
                         print("[DEBUGGER] Invalid value: '{}'".format(entry))
                     else:
-                        print("[DEBUGGER] Memory at {0:=#010x} set to {1:=#010x} ({1})".format(location * 4, value))
-                        mips.MEM[location] = value
-                        location += 1
+                        print("[DEBUGGER] Memory at {0:=#010x} set to {1:=#010x} ({1})".format((location + len(values)) * 4, value))
+                        values.append(value)
+                mips.write_words(location, values) # write all the entered values at once
+                changed_by_hand()
         elif command == "r":
             try:
                 params = param.strip().split(maxsplit=1)
                 register, value = int(params[0]), mippits.normalize(int(params[1], 0))
                 assert 0 <= register <= 31, "Invalid register: {}".format(register)
                 mips.registers[register] = value
+                changed_by_hand()
                 print("[DEBUGGER] Register ${0} set to {1:=#010x} ({1})".format(register, value))
             except:
                 print("[DEBUGGER] Invalid register/value: {}".format(param))
+        elif command == "watch":
+            try:
+                bounds = param.split()
+                access = bounds.pop() if bounds[-1] in ("r", "w", "rw") else "rw"
+                assert 1 <= len(bounds) <= 2
+                start = int(bounds[0], 0)
+                end = int(bounds[-1], 0) + 4 # the end address is included, like in `p`
+            except (AttributeError, IndexError, AssertionError, ValueError):
+                print("[DEBUGGER] Invalid watchpoint: {}".format(param))
+            else:
+                watchpoint = (start, end, access)
+                if watchpoint in watchpoints:
+                    watchpoints.remove(watchpoint)
+                    print("[DEBUGGER] Watchpoint removed from {:=#010x} to {:=#010x}".format(start, end - 4))
+                else:
+                    watchpoints.append(watchpoint)
+                    print("[DEBUGGER] Watchpoint added from {:=#010x} to {:=#010x} for {}".format(start, end - 4, {"r": "reads", "w": "writes", "rw": "reads and writes"}[access]))
         elif command == "t":
             if mips.tracing:
                 mips.tracing = False
@@ -125,55 +182,86 @@ def breakpoint_prompt():
             else:
                 mips.tracing = True
                 print("[DEBUGGER] Instruction tracing enabled")
+        elif command == "save":
+            global saved_state
+            saved_state = mips.snapshot() if recording is None else recording.save(mips)
+            print("[DEBUGGER] State saved at {:=#010x}".format(mips.PC))
+        elif command == "restore":
+            if saved_state is None: print("[DEBUGGER] No saved state, use `save` first")
+            else:
+                if recording is None: mips.restore(saved_state)
+                else: recording.restore(mips, saved_state)
+                print("[DEBUGGER] State restored, now at {:=#010x}".format(mips.PC))
         else: print("[DEBUGGER] Unrecognized command: {}".format(command))
 
 def print_help():
     print("{} --help".format(sys.argv[0]))
     print("    Shows this help message.")
     print()
-    print("{} [--trace] [--breakpoints=b_1,...,b_n] [--offset=o] file".format(sys.argv[0]))
+    print("{} [--trace] [--record] [--checkpoint-interval=n] [--breakpoints=b_1,...,b_n] [--offset=o] [--input=input_file] file".format(sys.argv[0]))
     print("    Starts debugging `file`. If `--trace` is specified, instruction tracing is enabled.")
+    print("    If `--record` is specified, execution is recorded so that the `rs` and `rc` commands can go back in time, with a checkpoint every `n` instructions (defaulting to 100000).")
     print("    If `--offset` is specified, the code is loaded at address `o` (defaulting to 0) and execution begins there.")
+    print("    If `--input` is specified, the program reads its input from `input_file` rather than the terminal.")
     print("    Breakpoints can be specified as `b_1,...,b_n` where each `b_1` to `b_n` is an address.")
 
 # parse command line arguments
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "", ["help", "trace", "breakpoints=", "offset="])
+    opts, args = getopt.getopt(sys.argv[1:], "", ["help", "trace", "record", "checkpoint-interval=", "breakpoints=", "offset=", "input="])
 except getopt.GetoptError as err:
     print(err)
     print()
     print_help()
     sys.exit(2)
 trace = False
-breakpoints = set()
+record, checkpoint_interval = False, 100000
+breakpoints = set() # addresses to stop at
+watchpoints = [] # `(start, end, access)` tuples for memory to watch, see `Mippit.run_until`
+saved_state = None # snapshot saved by the `save` command
 offset = 0
+input_path = None
 for opt, arg in opts:
     if opt == "--help":
         print_help()
         sys.exit()
     elif opt == "--trace":
         trace = True
+    elif opt == "--record":
+        record = True
+    elif opt == "--checkpoint-interval":
+        checkpoint_interval = int(arg)
     elif opt == "--breakpoints":
         breakpoints = set(int(x, 0) for x in arg.split(","))
     elif opt == "--offset":
         offset = int(arg, 0)
         assert offset % 4 == 0, "Value must be a multiple of 4"
+    elif opt == "--input":
+        input_path = arg
 if len(args) == 0:
     try:
         code = sys.stdin.buffer.read() # read MIPS assembly from stdin in binary mode
     except OSError:
-        print("[DEBUGGER] Could not read standard input: {}".format(file_path))
+        print("[DEBUGGER] Could not read standard input")
+        sys.exit(1)
 elif len(args) == 1:
     try:
         with open(args[0], "rb") as f: code = f.read()
     except OSError:
-        print("[DEBUGGER] Could not read file: {}".format(file_path))
+        print("[DEBUGGER] Could not read file: {}".format(args[0]))
+        sys.exit(1)
 else:
     print_help()
     sys.exit(2)
 
 mips = mippits.Mippit()
 mips.tracing = trace # enable or disable tracing
+if input_path is not None:
+    try:
+        mips.input = mippits.StreamInput(open(input_path, "rb"))
+    except OSError:
+        print("[DEBUGGER] Could not read input file: {}".format(input_path))
+        sys.exit(1)
+else: mips.input = mippits.TerminalInput() # stdin is used for debugger commands, so the program reads keypresses directly
 mips.load(code, offset)
     
 # add breakpoints from the code
@@ -183,16 +271,25 @@ for address, instruction in mips.MEM.items():
         breakpoints.add(address * 4)
 
 mips.PC = offset # start executing at the desired offset
+recording = replay.Recording(mips, checkpoint_interval) if record else None # recording of execution for going back in time
+stops = breakpoint_prompt() if mips.PC in breakpoints else set() # `run_until` doesn't stop at the first instruction
 while True:
-    if mips.PC in breakpoints: breakpoint_prompt()
     try:
-        if not mips.step(): break
+        reason = run_until(breakpoints | stops, watchpoints) # runs at full speed until the next breakpoint or watchpoint
     except AssertionError as e:
         print("[DEBUGGER] FATAL EXCEPTION: {}".format(e))
-        breakpoint_prompt()
+        position = (mips.steps, mips.PC)
+        stops = breakpoint_prompt()
+        if (mips.steps, mips.PC) != position: continue # went back in time, so the program can keep running
+        reason = mippits.HALTED
+    if reason == mippits.HALTED:
+        mips.output.flush()
+        print("[DEBUGGER] REACHED END OF PROGRAM")
+        position = (mips.steps, mips.PC)
+        stops = breakpoint_prompt()
+        if (mips.steps, mips.PC) != position: continue # went back in time, so the program can keep running
         break
-
-print("[DEBUGGER] REACHED END OF PROGRAM")
-breakpoint_prompt()
+    if reason == mippits.WATCHPOINT: print_watch_hit()
+    stops = breakpoint_prompt()
 
 print("[DEBUGGER] Program exited normally.")
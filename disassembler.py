@@ -2,31 +2,100 @@
 
 import sys, getopt
 
-import mippits
+import mippits, cfg
+
+try: import numpy
+except ImportError: numpy = None # NumPy is optional, without it we use the slower pure Python path
+
+CHUNK_LINES = 65536 # number of lines to write to the output at a time
+
+def code_words(code): # big-endian 32-bit words of `code`, as a NumPy array if NumPy is available and an `array("I")` otherwise
+    assert len(code) % 4 == 0, "Invalid code length - machine code must be collection of 32-bit words"
+    if numpy is not None: return numpy.frombuffer(code, dtype=">u4")
+    return mippits.code_to_words(code)
+
+def disassemble(words):
+    """
+    Returns a list with the assembly for each word in `words`, treating the word after each `lis` as a literal word.
+
+    Each distinct word is only decoded once, which makes a big difference for compiler output, where the same instructions appear over and over.
+    """
+    if numpy is not None:
+        distinct, inverse = numpy.unique(words, return_inverse=True)
+        decoded = [mippits.decode(word) for word in distinct.tolist()]
+        lines = [decoded[i] for i in inverse.tolist()]
+        lis_indices = numpy.flatnonzero((words & 0b11111111111111110000011111111111) == 0b00000000000000000000000000010100).tolist() # positions of `lis` instructions
+    else:
+        cache = {}
+        lines = [cache[word] if word in cache else cache.setdefault(word, mippits.decode(word)) for word in words]
+        lis_words = {word for word in cache if word & 0b11111111111111110000011111111111 == 0b00000000000000000000000000010100}
+        lis_indices = [index for index, word in enumerate(words) if word in lis_words] if lis_words else []
+
+    literal_index = -1 # position of the literal word of the last `lis` instruction
+    for index in lis_indices: # load immediate and skip is always followed by a literal word
+        if index == literal_index: continue # this is the literal word of the previous `lis`, not an instruction
+        literal_index = index + 1
+        if literal_index < len(lines): lines[literal_index] = ".word {}".format(mippits.signed(int(words[literal_index])))
+    return lines
+
+def format_lines(words, lines, output_format, labels = None): # yields the output line for each word, in the given format, with the labels in `labels` (a mapping from addresses to names) if it isn't `None`
+    if output_format == "text":
+        if labels is None: yield from lines
+        else:
+            for index, line in enumerate(lines):
+                if index * 4 in labels: yield labels[index * 4] + ":"
+                yield line
+        return
+    if output_format == "csv": yield "address,word,mnemonic,operands" + (",label" if labels is not None else "")
+    for index, line in enumerate(lines):
+        mnemonic, _, operands = line.partition(" ")
+        if output_format == "json": # mnemonics, operands, and labels never need escaping
+            label = ', "label": "{}"'.format(labels.get(index * 4, "")) if labels is not None else ""
+            yield '{{"address": {}, "word": {}, "mnemonic": "{}", "operands": "{}"{}}}'.format(index * 4, int(words[index]), mnemonic, operands, label)
+        else:
+            label = "," + labels.get(index * 4, "") if labels is not None else ""
+            yield '{:=#010x},{:=#010x},{},"{}"{}'.format(index * 4, int(words[index]), mnemonic, operands, label)
+
+def write_chunked(output_lines, stream): # write lines to `stream` in large chunks rather than one line at a time
+    chunk = []
+    for line in output_lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_LINES:
+            stream.write("\n".join(chunk) + "\n")
+            chunk = []
+    if chunk: stream.write("\n".join(chunk) + "\n")
 
 # parse command line arguments
-def print_help(): print("Usage: {} < MIPS_ASSEMBLED.mips > MIPS_DISASSEMBLED.asm".format(sys.argv[0]), file=sys.stderr)
-try:
-    opts, args = getopt.getopt(sys.argv[1:], "", ["help"])
-except getopt.GetoptError as err:
-    print_help()
-    sys.exit(2)
-for opt, arg in opts:
-    if opt == "--help":
+def print_help(): print("Usage: {} [--format=text|json|csv] [--labels] [MIPS_ASSEMBLED.mips] < MIPS_ASSEMBLED.mips > MIPS_DISASSEMBLED.asm".format(sys.argv[0]), file=sys.stderr)
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "format=", "labels"])
+    except getopt.GetoptError as err:
         print_help()
-        sys.exit()
-if len(args) != 0:
-    print_help()
-    sys.exit(2)
-
-code = sys.stdin.buffer.read()
-words = mippits.code_to_words(code)
-index = 0
-while index < len(words):
-    assembly_instruction = mippits.decode(words[index])
-    print(assembly_instruction)
-    if assembly_instruction.startswith("lis "): # load immediate and skip is always followed by a literal word
-        if index < len(words) - 1: # there is a word after this one
-            index += 1 # move to the literal word
-            print(".word {}".format(words[index])) # display the literal word
-    index += 1 # move to the next word
+        sys.exit(2)
+    output_format, labelled = "text", False
+    for opt, arg in opts:
+        if opt == "--help":
+            print_help()
+            sys.exit()
+        elif opt == "--format":
+            if arg not in ("text", "json", "csv"):
+                print_help()
+                sys.exit(2)
+            output_format = arg
+        elif opt == "--labels":
+            labelled = True
+    if len(args) > 1:
+        print_help()
+        sys.exit(2)
+
+    if args: code = mippits.read_code(args[0]) # large binaries are memory-mapped
+    else: code = sys.stdin.buffer.read()
+    if labelled: # follow the control flow from the start of the code, so that branch targets get labels and data isn't shown as instructions
+        words = mippits.code_to_words(code)
+        graph = cfg.ControlFlowGraph(words)
+        write_chunked(format_lines(words, graph.disassemble(), output_format, graph.labels), sys.stdout)
+    else:
+        words = code_words(code)
+        write_chunked(format_lines(words, disassemble(words), output_format), sys.stdout)
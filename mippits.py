@@ -1,20 +1,23 @@
 #!/usr/bin/env python3
 
+import sys, os, struct, mmap
+from array import array
+from itertools import count
+
 def normalize(value):
     return value & 0xFFFFFFFF
 def signed(value):
     return value - 0x100000000 if value & 0x80000000 else value
 
 # from http://code.activestate.com/recipes/577977-get-single-keypress/, MIT licensed
-try:
-    import tty, termios
-except ImportError:
-    # Probably Windows.
-    try: import msvcrt
-    except ImportError: raise ImportError("getch not available")
-    else: getch = msvcrt.getch
-else:
-    import sys
+def load_getch(): # returns the `getch` for this platform, importing the terminal modules it needs
+    try:
+        import tty, termios
+    except ImportError:
+        # Probably Windows.
+        try: import msvcrt
+        except ImportError: raise ImportError("getch not available")
+        else: return msvcrt.getch
     def getch():
         """
         getch() -> key character
@@ -30,16 +33,305 @@ else:
             ch = sys.stdin.read(1)
         finally: termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
         return ch
+    return getch
+
+def getch(): # replaces itself with the real `getch` when first called, so that programs that never read from the terminal don't pay for importing the terminal modules
+    global getch
+    getch = load_getch()
+    return getch()
+
+# devices for the memory-mapped I/O ports - input devices have a `read()` method that returns the next byte, or 0xFFFFFFFF (-1) at end of input, and an `interactive` attribute that says whether output should be flushed before reading
+# output devices have a `write(value)` method that writes the lowest byte of `value`, and a `flush()` method that makes sure everything written so far has been written out
+
+class TerminalInput: # reads keypresses from the terminal in raw mode, one at a time, without waiting for Enter
+    interactive = True
+    
+    def read(self):
+        ch = getch()
+        if not ch: return 0xFFFFFFFF # end of input
+        value = ord(ch)
+        assert 0 <= value <= 255, "Invalid character entered - character must be ASCII"
+        return value
+
+class StreamInput: # reads from a binary stream such as a file or a pipe, a block at a time
+    interactive = False
+    
+    def __init__(self, stream, block_size = 65536):
+        self.read_block = getattr(stream, "read1", stream.read) # `read1` doesn't wait for the whole block to be available, which matters for pipes
+        self.block_size = block_size
+        self.buffer, self.position = b"", 0
+    
+    def read(self):
+        if self.position >= len(self.buffer): # buffer used up, read the next block
+            self.buffer, self.position = self.read_block(self.block_size), 0
+            if not self.buffer: return 0xFFFFFFFF # end of input
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+class BytesInput: # reads from a bytes-like object
+    interactive = False
+    
+    def __init__(self, data):
+        self.data, self.position = bytes(data), 0
+    
+    def read(self):
+        if self.position >= len(self.data): return 0xFFFFFFFF # end of input
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+class InputPending(Exception): # raised by `FeedInput` when the program reads input that hasn't arrived yet, see `Mippit.run_slice`
+    pass
+
+class FeedInput: # reads data that is fed in as it arrives, raising `InputPending` if the program gets ahead of it, for programs run with `Mippit.run_slice`
+    interactive = False
+    
+    def __init__(self):
+        self.buffer, self.position = bytearray(), 0
+        self.closed = False
+    
+    def feed(self, data): # make `data` available to the program
+        del self.buffer[:self.position] # drop the data that was already read
+        self.buffer += data
+        self.position = 0
+    
+    def close(self): # signal the end of input, once all the data fed so far has been read
+        self.closed = True
+    
+    def read(self):
+        if self.position >= len(self.buffer):
+            if self.closed: return 0xFFFFFFFF # end of input
+            raise InputPending()
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+class StreamOutput: # writes to a binary stream, buffering output until `flush` is called or the buffer fills up
+    def __init__(self, stream, buffer_size = 65536):
+        self.stream, self.buffer_size = stream, buffer_size
+        self.buffer = bytearray()
+    
+    def write(self, value):
+        self.buffer.append(value & 0xFF)
+        if len(self.buffer) >= self.buffer_size: self.flush()
+    
+    def flush(self):
+        if not self.buffer: return
+        self.stream.write(self.buffer)
+        self.stream.flush()
+        self.buffer = bytearray()
+
+class StdoutOutput(StreamOutput): # writes to whatever `sys.stdout` is at the time of flushing, after anything already printed to it
+    def __init__(self, buffer_size = 65536):
+        super().__init__(None, buffer_size)
+    
+    def flush(self):
+        if not self.buffer: return
+        sys.stdout.flush()
+        if hasattr(sys.stdout, "buffer"): sys.stdout.buffer.write(self.buffer)
+        else: sys.stdout.write(self.buffer.decode("latin-1")) # text-only stream, such as `io.StringIO`, so use one character per byte
+        sys.stdout.flush()
+        self.buffer = bytearray()
+
+class BytesOutput: # collects output in memory
+    def __init__(self):
+        self.buffer = bytearray()
+    
+    def write(self, value): self.buffer.append(value & 0xFF)
+    def flush(self): pass
+    def getvalue(self): return bytes(self.buffer)
+    def take(self): # return the output collected so far and start collecting again
+        value, self.buffer = bytes(self.buffer), bytearray()
+        return value
+
+def default_input(): # raw terminal input if stdin is a terminal, buffered input from stdin otherwise
+    if sys.stdin is None: return BytesInput(b"") # no stdin at all, such as under `pythonw`
+    if sys.stdin.isatty(): return TerminalInput()
+    return StreamInput(sys.stdin.buffer)
+
+PAGE_BITS = 10 # each memory page holds 2**PAGE_BITS words
+PAGE_WORDS = 1 << PAGE_BITS
+PAGE_MASK = PAGE_WORDS - 1
+
+class Memory:
+    """
+    Word-addressed memory, made up of fixed-size pages of unsigned 32-bit words that are allocated the first time they are written to.
+
+    Words that have never been written read as 0. Memory is indexed by word index (the byte address divided by 4), like a list: `memory[index]` reads a word and `memory[index] = value` writes one.
+
+    Pages are shared with snapshots taken by `snapshot` until they are written to, at which point the page is copied. Writes must therefore go through `writable` rather than `pages`.
+    """
+    def __init__(self):
+        self.pages = {} # mapping from page numbers to `array("I")` objects holding the words of that page
+        self.writable = {} # mapping from page numbers to pages that aren't shared with a snapshot and can be modified in place - a subset of `pages`
+        self.base = None # page mapping of the snapshot that the pages not in `writable` are shared with
+    
+    def writable_page(self, page_number): # make page `page_number` writable, by allocating it filled with zeros or copying it from a snapshot, and return it
+        page = self.pages.get(page_number)
+        page = array("I", bytes(PAGE_WORDS * 4)) if page is None else array("I", page)
+        self.pages[page_number] = self.writable[page_number] = page
+        return page
+    
+    def snapshot(self): # returns a page mapping that will keep the current contents of memory, see `restore`
+        self.writable.clear() # every page is now shared with the snapshot
+        self.base = dict(self.pages)
+        return self.base
+    
+    def restore(self, base): # set the contents of memory to those of the page mapping `base` from `snapshot`, and return the page numbers of pages that might have changed
+        if base is self.base: # restoring the most recent snapshot, so only the pages that were written since are different
+            changed = list(self.writable)
+            for page_number in changed:
+                if page_number in base: self.pages[page_number] = base[page_number]
+                else: del self.pages[page_number]
+        else:
+            changed = set(self.pages) | set(base)
+            self.pages.clear()
+            self.pages.update(base)
+        self.writable.clear()
+        self.base = base
+        return changed
+    
+    def __getitem__(self, index):
+        page = self.pages.get(index >> PAGE_BITS)
+        return page[index & PAGE_MASK] if page is not None else 0
+    
+    def __setitem__(self, index, value):
+        page = self.writable.get(index >> PAGE_BITS)
+        if page is None: page = self.writable_page(index >> PAGE_BITS)
+        page[index & PAGE_MASK] = value & 0xFFFFFFFF
+    
+    def __contains__(self, index): # whether the word at `index` is in an allocated page
+        return index >> PAGE_BITS in self.pages
+    
+    def items(self): # iterate over `(index, value)` pairs for every nonzero word, in order of index
+        for page_number in sorted(self.pages):
+            base = page_number << PAGE_BITS
+            for offset, value in enumerate(self.pages[page_number]):
+                if value: yield base + offset, value
+    
+    def read_words(self, index, count): # read `count` words starting at word index `index` into a new `array("I")`
+        result = array("I")
+        while count > 0:
+            page_number, offset = index >> PAGE_BITS, index & PAGE_MASK
+            chunk = min(count, PAGE_WORDS - offset)
+            page = self.pages.get(page_number)
+            if page is None: result.frombytes(bytes(chunk * 4))
+            else: result.extend(page[offset:offset + chunk])
+            index, count = index + chunk, count - chunk
+        return result
+    
+    def write_words(self, index, words): # write the unsigned 32-bit values in `words` starting at word index `index`
+        words = words if isinstance(words, array) and words.typecode == "I" else array("I", (normalize(word) for word in words))
+        position = 0
+        while position < len(words):
+            page_number, offset = index >> PAGE_BITS, index & PAGE_MASK
+            chunk = min(len(words) - position, PAGE_WORDS - offset)
+            page = self.writable.get(page_number)
+            if page is None: page = self.writable_page(page_number)
+            page[offset:offset + chunk] = words[position:position + chunk]
+            index, position = index + chunk, position + chunk
+    
+    def fill(self, index, count, value = 0): # set `count` words starting at word index `index` to `value`
+        value = normalize(value)
+        while count > 0:
+            page_number, offset = index >> PAGE_BITS, index & PAGE_MASK
+            chunk = min(count, PAGE_WORDS - offset)
+            page = self.writable.get(page_number)
+            if page is None:
+                if value == 0 and page_number not in self.pages: # untouched pages already read as zeros, don't bother allocating them
+                    index, count = index + chunk, count - chunk
+                    continue
+                page = self.writable_page(page_number)
+            page[offset:offset + chunk] = array("I", [value]) * chunk
+            index, count = index + chunk, count - chunk
+    
+    def view(self, page_number): # memoryview of the words of page `page_number` in native byte order, or `None` if the page was never written to - the page may be shared with snapshots, so don't modify it
+        page = self.pages.get(page_number)
+        return memoryview(page) if page is not None else None
+
+# special destinations in trace records, besides register numbers 0 to 31
+DESTINATION_LO = 32 # `mult`, `multu`, `div`, and `divu` record the new value of LO
+DESTINATION_MEMORY = 0x80000000 # `sw` records this flag combined with the word index of the stored address
+DESTINATION_NONE = 0xFFFFFFFF # instructions that don't write anything
+DESTINATION_FAULT = 0xFFFFFFFE # instructions that raised an exception
+
+class TraceBuffer:
+    """
+    Ring buffer of fixed-size binary trace records, keeping only the most recent `capacity` records.
+
+    Each record is four unsigned 32-bit little-endian integers: the address of the instruction, the instruction word, its destination (see `DESTINATION_LO` and friends), and the new value of the destination. Records are only turned into text when `format` is called.
+    """
+    RECORD = struct.Struct("<IIII")
+    
+    def __init__(self, capacity = 65536):
+        assert capacity > 0, "Trace buffer capacity must be positive"
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * self.RECORD.size)
+        self.count = 0 # total number of records ever written, including overwritten ones
+    
+    def record(self, pc, instruction, destination, value):
+        self.RECORD.pack_into(self.buffer, (self.count % self.capacity) * self.RECORD.size, pc, instruction, destination, value & 0xFFFFFFFF)
+        self.count += 1
+    
+    def dump(self): # binary contents of the buffer, oldest record first
+        if self.count <= self.capacity: return bytes(self.buffer[:self.count * self.RECORD.size])
+        split = (self.count % self.capacity) * self.RECORD.size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+    
+    def records(self): # list of `(pc, instruction, destination, value)` tuples, oldest record first
+        return list(self.RECORD.iter_unpack(self.dump()))
+    
+    def format(self): # human readable lines describing each record, oldest record first
+        lines = []
+        for pc, instruction, destination, value in self.records():
+            if destination == DESTINATION_NONE: comment = ""
+            elif destination == DESTINATION_FAULT: comment = "raised an exception"
+            elif destination == DESTINATION_LO: comment = "LO={}".format(value)
+            elif destination & DESTINATION_MEMORY: comment = "MEM[{:=#010x}]={}".format(normalize((destination & ~DESTINATION_MEMORY) * 4), value)
+            else: comment = "${}={}".format(destination, value)
+            lines.append("{:=#010x}    {:<20}; {}".format(pc, decode(instruction), comment))
+        return lines
+
+class Snapshot: # saved state of a `Mippit`, see `Mippit.snapshot`
+    def __init__(self, mips):
+        self.registers = list(mips.registers)
+        self.PC, self.HI, self.LO = mips.PC, mips.HI, mips.LO
+        self.offset, self.steps, self.fault = mips.offset, mips.steps, mips.fault
+        self.pages = mips.MEM.snapshot()
+
+# reasons for a run to stop, returned by `Mippit.resume`
+HALTED = "halted" # the program jumped past the end of memory
+STEP_LIMIT = "step limit" # the maximum number of steps were executed
+BREAKPOINT = "breakpoint" # the program reached a breakpoint, see `Mippit.run_until`
+WATCHPOINT = "watchpoint" # the program accessed watched memory, see `Mippit.run_until`
+RUNNING = "running" # the program can keep running, see `Mippit.run_slice`
+WAITING = "waiting for input" # the program is waiting for input to be fed in, see `Mippit.run_slice`
+FAULTED = "faulted" # the program raised an exception, see `Mippit.run_slice`
 
 class Mippit:
     def __init__(self):
         self.registers = [0] * 32
         self.PC = 0
         self.HI, self.LO = 0, 0
-        self.MEM = {}
+        self.MEM = Memory()
+        self.decoded = {} # mapping from word indices to predecoded instructions, see `predecode`
+        self.entries = {} # mapping from instruction words to their predecoded instructions, shared by every word index holding the same instruction
+        self.blocks = {} # mapping from addresses to `(function, length)` tuples for the compiled basic blocks starting there, see `blocks.py`
+        self.block_words = {} # mapping from word indices to the start addresses of the compiled blocks that cover them
         
         self.offset = self.PC
-        self.tracing = False
+        self.steps = 0 # number of instructions executed so far
+        self.fault = None # exception the program raised while running with `run_slice`, if any
+        self.watch_hit = None # `(address, access)` of the memory access that triggered the last watchpoint, see `run_until`
+        self.input = default_input() # device for loads from 0xFFFF0004
+        self.output = StdoutOutput() # device for stores to 0xFFFF000C
+        self.tracing = False # print each instruction as it executes
+        self.trace_buffer = None # `TraceBuffer` to record executed instructions into, or `None` to disable recording
+        self.compile_blocks = False # run programs as compiled basic blocks rather than one instruction at a time
+        self.fusion = False # run common instruction sequences as single fused instructions, see `fuse`
+        self.fused = {} # mapping from word indices to the instructions to dispatch there when `fusion` is enabled, see `fuse`
+        self.profile = None # `profiler.Profile` to record execution counts into, or `None` to disable profiling
     
     def trace(self, instruction, comment = None):
         if not self.tracing: return # tracing disabled
@@ -83,7 +375,7 @@ class Mippit:
             self.trace("mflo ${}".format(d), "${}={}".format(d, r[d]))
         elif instruction & 0b11111111111111110000011111111111 == 0b00000000000000000000000000010100: # load immediate and skip (lis)
             assert self.PC % 4 == 0
-            r[d] = self.MEM[self.PC // 4] if self.PC // 4 in self.MEM else 0
+            r[d] = self.MEM[self.PC // 4]
             self.PC = normalize(self.PC + 4)
             self.trace("lis ${}".format(d), "${}={}".format(d, r[d]))
             self.trace(".word {}".format(r[d]))
@@ -91,17 +383,19 @@ class Mippit:
             address = normalize(r[s] + i)
             assert address % 4 == 0
             if address == 0xFFFF0004: # read from stdin
-                value = ord(getch())
-                assert 0 <= value <= 255, "Invalid character entered - character must be ASCII"
-                r[t] = value
-            else: r[t] = self.MEM[address // 4] if address // 4 in self.MEM else 0
+                self.output.flush() # make sure the output appears before the trace and any prompt for input
+                r[t] = self.input.read()
+            else: r[t] = self.MEM[address // 4]
             self.trace("lw ${}, {}(${})".format(t, i, s), "${}={}, ${}={}".format(t, r[t], s, r[s]))
         elif instruction & 0b11111100000000000000000000000000 == 0b10101100000000000000000000000000: # store word (sw)
             address = normalize(r[s] + i)
             assert address % 4 == 0, "Invalid address - not aligned to word boundary."
             if address == 0xFFFF000C: # write to stdout
-                print(chr(r[t] & 0xFF), end="")
-            else: self.MEM[address // 4] = r[t]
+                self.output.write(r[t])
+                self.output.flush() # make sure the output appears before the trace
+            else:
+                self.MEM[address // 4] = r[t]
+                if address // 4 in self.decoded: self.invalidate(address // 4) # self-modifying code
             self.trace("sw ${}, {}(${})".format(t, i, s), "${}={}, ${}={}".format(t, r[t], s, r[s]))
         elif instruction & 0b11111100000000000000011111111111 == 0b00000000000000000000000000101010: # set less than (slt)
             r[d] = 1 if signed(r[s]) < signed(r[t]) else 0
@@ -125,86 +419,620 @@ class Mippit:
             self.trace("jalr ${}".format(s), "${}={}".format(s, r[s]))
         else: raise ValueError("Unknown instruction: {:=#010x}".format(instruction))
     
+    def predecode(self, index): # decode the word at word index `index` into a handler and its operands, caching the result
+        word = self.MEM[index]
+        entry = self.entries.get(word) # the same instructions appear over and over in compiled code, so each distinct word is only decoded once
+        if entry is None: entry = self.entries[word] = self.decode_entry(word)
+        self.decoded[index] = entry
+        return entry
+    
+    def decode_entry(self, instruction): # handler and operands for `instruction`, which only depend on the instruction itself and not on its address
+        name, a, b, c = classify(instruction)
+        if name is None: return (self._unknown, normalize(instruction), None, None)
+        if name == "beq" or name == "bne": return (getattr(self, "_" + name), a, b, c * 4) # branch offsets are in words, precompute the offset in bytes
+        return (getattr(self, "_" + name), a, b, c)
+    
+    def invalidate(self, index): # discard the cached decoding and compiled blocks of the word at word index `index`, must be called whenever that word is modified
+        self.decoded.pop(index, None)
+        if self.fused: # discard every fused sequence that could cover this word
+            for start in range(index - MAX_FUSED_WORDS + 1, index + 1): self.fused.pop(start, None)
+        if index in self.block_words: # discard every compiled block that covers this word
+            for start in self.block_words.pop(index): self.blocks.pop(start, None)
+    
+    def invalidate_all(self): # discard all cached decodings and compiled blocks, must be called whenever memory is modified in bulk
+        self.decoded.clear()
+        self.fused.clear()
+        self.blocks.clear()
+        self.block_words.clear()
+
+    def prebuild(self, graph):
+        """
+        Prepare the instructions in `graph`, a `cfg.ControlFlowGraph` of code in memory, ahead of time rather than when each one is first executed. Every instruction is predecoded, then the basic blocks are scanned for fused instructions if `fusion` is set, and compiled if `compile_blocks` is set.
+
+        Code that `graph` didn't find is still prepared when it is first executed, as usual.
+        """
+        indices = sorted(address >> 2 for address in graph.instructions)
+        MEM, decoded, entries = self.MEM, self.decoded, self.entries
+        for index in indices:
+            if index in decoded: continue
+            word = MEM[index]
+            decoded[index] = entries[word] if word in entries else entries.setdefault(word, self.decode_entry(word))
+        if self.fusion:
+            for index in indices:
+                if index not in self.fused: self.fuse(index)
+        if self.compile_blocks:
+            import blocks
+            for start in graph.blocks:
+                if start not in self.blocks: blocks.compile_block(self, start)
+
+    def snapshot(self):
+        """
+        Returns a `Snapshot` of the registers, PC, HI/LO, step count, fault, and memory, which can be passed to `restore` any number of times later on.
+
+        Memory pages are shared between the virtual machine and its snapshots, and are only copied when they are next written to, so this takes time proportional to the number of pages rather than the amount of memory.
+        """
+        return Snapshot(self)
+    
+    def restore(self, snapshot):
+        """
+        Set the registers, PC, HI/LO, step count, fault, and memory back to what they were when `snapshot` was taken. Input and output devices are left as they are.
+
+        Restoring the most recent snapshot takes time proportional to the number of pages written since it was taken.
+        """
+        self.registers[:] = snapshot.registers # modify in place, since the run loops keep a reference to the list
+        self.PC, self.HI, self.LO = snapshot.PC, snapshot.HI, snapshot.LO
+        self.offset, self.steps, self.fault = snapshot.offset, snapshot.steps, snapshot.fault
+        changed = set(self.MEM.restore(snapshot.pages))
+        if not changed: return
+        decoded = self.decoded # cached decodings of code in pages that might have changed are no longer valid
+        if len(changed) * PAGE_WORDS < len(decoded): indices = [index for page_number in changed for index in range(page_number << PAGE_BITS, (page_number + 1) << PAGE_BITS) if index in decoded] # look at the words in the changed pages
+        else: indices = [index for index in decoded if index >> PAGE_BITS in changed] # fewer decoded words than words in the changed pages
+        for index in indices: self.invalidate(index)
+    
+    def write_words(self, index, words): # write `words` to memory starting at word index `index`, invalidating any cached decodings of them
+        self.MEM.write_words(index, words)
+        for i in range(index, index + len(words)):
+            if i in self.decoded: self.invalidate(i)
+    
+    # instruction handlers for predecoded instructions - R-type handlers take `(d, s, t)`, I-type handlers take `(s, t, i)`
+    # these have the same semantics as the corresponding cases in `decode_execute`, but without tracing
+    def _add(self, d, s, t):
+        r = self.registers
+        r[d] = (r[s] + r[t]) & 0xFFFFFFFF
+    def _sub(self, d, s, t):
+        r = self.registers
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF
+    def _mult(self, d, s, t):
+        r = self.registers
+        result = signed(r[s]) * signed(r[t])
+        self.HI, self.LO = normalize(result >> 32), normalize(result)
+    def _multu(self, d, s, t):
+        r = self.registers
+        result = r[s] * r[t]
+        self.HI, self.LO = normalize(result >> 32), normalize(result)
+    def _div(self, d, s, t):
+        r = self.registers
+        self.HI, self.LO = normalize(signed(r[s]) % signed(r[t])), normalize(signed(r[s]) // signed(r[t]))
+    def _divu(self, d, s, t):
+        r = self.registers
+        self.HI, self.LO = r[s] % r[t], r[s] // r[t]
+    def _mfhi(self, d, s, t): self.registers[d] = self.HI
+    def _mflo(self, d, s, t): self.registers[d] = self.LO
+    def _lis(self, d, s, t):
+        assert self.PC % 4 == 0
+        index = self.PC >> 2
+        page = self.MEM.pages.get(index >> PAGE_BITS)
+        self.registers[d] = page[index & PAGE_MASK] if page is not None else 0
+        self.PC = (self.PC + 4) & 0xFFFFFFFF
+    def _lw(self, s, t, i):
+        r = self.registers
+        address = (r[s] + i) & 0xFFFFFFFF
+        assert address % 4 == 0
+        if address == 0xFFFF0004: # read from stdin
+            if self.input.interactive: self.output.flush() # show any prompt before waiting for input
+            r[t] = self.input.read()
+        else:
+            index = address >> 2
+            page = self.MEM.pages.get(index >> PAGE_BITS)
+            r[t] = page[index & PAGE_MASK] if page is not None else 0
+    def _sw(self, s, t, i):
+        r = self.registers
+        address = (r[s] + i) & 0xFFFFFFFF
+        assert address % 4 == 0, "Invalid address - not aligned to word boundary."
+        if address == 0xFFFF000C: self.output.write(r[t]) # write to stdout
+        else:
+            index = address >> 2
+            page = self.MEM.writable.get(index >> PAGE_BITS)
+            if page is None: page = self.MEM.writable_page(index >> PAGE_BITS)
+            page[index & PAGE_MASK] = r[t] & 0xFFFFFFFF
+            if index in self.decoded: self.invalidate(index) # self-modifying code
+    def _slt(self, d, s, t):
+        r = self.registers
+        r[d] = 1 if signed(r[s]) < signed(r[t]) else 0
+    def _sltu(self, d, s, t):
+        r = self.registers
+        r[d] = 1 if r[s] < r[t] else 0
+    def _beq(self, s, t, offset):
+        r = self.registers
+        if r[s] == r[t]: self.PC = (self.PC + offset) & 0xFFFFFFFF
+    def _bne(self, s, t, offset):
+        r = self.registers
+        if r[s] != r[t]: self.PC = (self.PC + offset) & 0xFFFFFFFF
+    def _jr(self, d, s, t): self.PC = self.registers[s]
+    def _jalr(self, d, s, t):
+        r = self.registers
+        temp = r[s]
+        r[31] = self.PC
+        self.PC = temp
+    def _unknown(self, instruction, _1, _2): raise ValueError("Unknown instruction: {:=#010x}".format(instruction))
+    
+    # fused instruction handlers, see `fuse` - each one runs a whole sequence of instructions and leaves `self.offset`, `self.PC`, and `self.steps` as if they were run one at a time
+    # `self.steps` is increased by one less than the number of instructions run, since `interpret_fused` counts one step for each dispatch
+    # arithmetic operands are `(subtract, d, s, t)` for `add`/`sub`, load and store operands are `(s, t, i)`
+    def _fused_lis_jalr(self, x, value, _): # `lis $x`, `.word value`, `jalr $x`
+        r = self.registers
+        r[x] = value
+        self.offset += 8
+        r[31] = self.offset + 4
+        self.PC = value
+        self.steps += 1
+    def _fused_lis_arith(self, x, value, arithmetic): # `lis $x`, `.word value`, `add`/`sub`
+        r = self.registers
+        r[x] = value
+        subtract, d, s, t = arithmetic
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF if subtract else (r[s] + r[t]) & 0xFFFFFFFF
+        self.offset += 8
+        self.PC = self.offset + 4
+        self.steps += 1
+    def _fused_lis_arith_lw(self, x, value, operands): # `lis $x`, `.word value`, `add`/`sub`, `lw` - popping the stack
+        r = self.registers
+        r[x] = value
+        subtract, d, s, t, load_s, load_t, load_i = operands
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF if subtract else (r[s] + r[t]) & 0xFFFFFFFF
+        self.offset += 12
+        self.PC = self.offset + 4
+        self.steps += 2 # count the instructions before the load, in case it raises an exception
+        address = (r[load_s] + load_i) & 0xFFFFFFFF
+        if address == 0xFFFF0004 or address & 3: self._lw(load_s, load_t, load_i) # reading input or misaligned
+        else:
+            page = self.MEM.pages.get(address >> (PAGE_BITS + 2))
+            r[load_t] = page[(address >> 2) & PAGE_MASK] if page is not None else 0
+    def _fused_sw_arith(self, store, arithmetic, _): # `sw`, `add`/`sub` - pushing onto the stack
+        if self.fused_store(*store): return # the store modified this sequence, continue one instruction at a time
+        r = self.registers
+        subtract, d, s, t = arithmetic
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF if subtract else (r[s] + r[t]) & 0xFFFFFFFF
+        self.offset += 4
+        self.PC = self.offset + 4
+        self.steps += 1
+    def _fused_sw_lis_arith(self, store, literal, arithmetic): # `sw`, `lis $x`, `.word value`, `add`/`sub` - pushing onto the stack
+        if self.fused_store(*store): return # the store modified this sequence, continue one instruction at a time
+        r = self.registers
+        x, value = literal
+        r[x] = value
+        subtract, d, s, t = arithmetic
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF if subtract else (r[s] + r[t]) & 0xFFFFFFFF
+        self.offset += 12
+        self.PC = self.offset + 4
+        self.steps += 2
+    def _fused_arith_lw(self, arithmetic, load, _): # `add`/`sub`, `lw` - popping the stack
+        r = self.registers
+        subtract, d, s, t = arithmetic
+        r[d] = (r[s] - r[t]) & 0xFFFFFFFF if subtract else (r[s] + r[t]) & 0xFFFFFFFF
+        self.offset += 4
+        self.PC = self.offset + 4
+        self.steps += 1 # count the instruction before the load, in case it raises an exception
+        load_s, load_t, load_i = load
+        address = (r[load_s] + load_i) & 0xFFFFFFFF
+        if address == 0xFFFF0004 or address & 3: self._lw(load_s, load_t, load_i) # reading input or misaligned
+        else:
+            page = self.MEM.pages.get(address >> (PAGE_BITS + 2))
+            r[load_t] = page[(address >> 2) & PAGE_MASK] if page is not None else 0
+    def fused_store(self, s, t, i): # same as `_sw`, but returns whether the store discarded the fused sequence being run
+        r = self.registers
+        address = (r[s] + i) & 0xFFFFFFFF
+        if address == 0xFFFF000C: # write to stdout
+            self.output.write(r[t])
+            return False
+        if address & 3: return self._sw(s, t, i) # raises the same exception as `_sw` for misaligned addresses
+        index = address >> 2
+        page = self.MEM.writable.get(index >> PAGE_BITS)
+        if page is None: page = self.MEM.writable_page(index >> PAGE_BITS)
+        page[index & PAGE_MASK] = r[t] & 0xFFFFFFFF
+        if index not in self.decoded: return False
+        self.invalidate(index) # self-modifying code
+        return self.offset >> 2 not in self.fused
+    def _fused_compare_branch(self, comparison, branch, _): # `slt`/`sltu`, `beq`/`bne`, where branch operands are `(equal, s, t, offset)`
+        r = self.registers
+        unsigned, d, s, t = comparison
+        if unsigned: r[d] = 1 if r[s] < r[t] else 0
+        else: r[d] = 1 if signed(r[s]) < signed(r[t]) else 0
+        equal, s, t, offset = branch
+        self.offset += 4
+        PC = self.offset + 4
+        self.PC = (PC + offset) & 0xFFFFFFFF if (r[s] == r[t]) == equal else PC
+        self.steps += 1
+    def _fused_multiply_move(self, operation, d, high): # `mult`/`multu`/`div`/`divu`, then `mfhi $d` if `high` is true or `mflo $d` otherwise
+        r = self.registers
+        self.HI, self.LO = HI, LO = multiply(operation, r) # if this raises an exception, nothing else has happened yet
+        r[d] = HI if high else LO
+        self.offset += 4
+        self.PC = self.offset + 4
+        self.steps += 1
+    def _fused_multiply_move_move(self, operation, first, second): # `mult`/`multu`/`div`/`divu`, then `mfhi`/`mflo` for the `(d, high)` in `first`, then for the one in `second`
+        r = self.registers
+        self.HI, self.LO = HI, LO = multiply(operation, r) # if this raises an exception, nothing else has happened yet
+        d, high = first
+        r[d] = HI if high else LO
+        d, high = second
+        r[d] = HI if high else LO
+        self.offset += 8
+        self.PC = self.offset + 4
+        self.steps += 2
+    
+    def fuse(self, index):
+        """
+        Returns the instruction to dispatch at word index `index` when `fusion` is enabled, and records it in `self.fused`. With `fusion` enabled, `interpret` calls this the first time it reaches each word index, so only code that actually runs is ever scanned.
+
+        If a sequence of instructions that CS241 compilers generate all the time starts at `index`, this is a fused instruction that runs the whole sequence in a single dispatch, with exactly the same results as running its instructions one at a time. Otherwise, it is just the predecoded instruction, so that dispatching only takes a single lookup.
+
+        The sequences are `lis $x`/`.word`/`jalr $x` calls, `sw` and `lw` combined with `add` and `sub` (possibly using `lis`) to push and pop the stack, `slt`/`sltu` followed by `beq`/`bne`, and `mult`/`multu`/`div`/`divu` followed by `mflo` and/or `mfhi`. Sequences where any instruction but the last writes to the 0 register aren't fused, since it is reset before every instruction.
+
+        Every word in a fused sequence is predecoded, so storing to any of them discards the fused instruction through `invalidate`. Jumping into the middle of a sequence never runs its fused instruction, since fused instructions are only used when the PC is at the start of the sequence.
+        """
+        match = self.fusable(index) if index <= 0x3FFFFFFF - MAX_FUSED_WORDS else None # sequences never wrap around the end of memory
+        if match is None: entry = self.decoded[index] if index in self.decoded else self.predecode(index)
+        else:
+            entry, words = match
+            for i in range(index, index + words):
+                if i not in self.decoded: self.predecode(i)
+        self.fused[index] = entry
+        return entry
+    
+    def fusable(self, index): # the fused instruction for the sequence starting at word index `index` and the number of words it covers, or `None` if there isn't one
+        MEM = self.MEM
+        name, a, b, c = classify(MEM[index])
+        if name == "lis" and a != 0:
+            value = MEM[index + 1]
+            name1, a1, b1, c1 = classify(MEM[index + 2])
+            if name1 == "jalr" and b1 == a: return (self._fused_lis_jalr, a, value, None), 3
+            if name1 in ("add", "sub"):
+                arithmetic = (name1 == "sub", a1, b1, c1)
+                name2, a2, b2, c2 = classify(MEM[index + 3])
+                if name2 == "lw" and a1 != 0: return (self._fused_lis_arith_lw, a, value, arithmetic + (a2, b2, c2)), 4
+                return (self._fused_lis_arith, a, value, arithmetic), 3
+        elif name == "sw":
+            name1, a1, b1, c1 = classify(MEM[index + 1])
+            if name1 == "lis" and a1 != 0:
+                name3, a3, b3, c3 = classify(MEM[index + 3])
+                if name3 in ("add", "sub"): return (self._fused_sw_lis_arith, (a, b, c), (a1, MEM[index + 2]), (name3 == "sub", a3, b3, c3)), 4
+            if name1 in ("add", "sub"): return (self._fused_sw_arith, (a, b, c), (name1 == "sub", a1, b1, c1), None), 2
+        elif name in ("add", "sub") and a != 0:
+            name1, a1, b1, c1 = classify(MEM[index + 1])
+            if name1 == "lw": return (self._fused_arith_lw, (name == "sub", a, b, c), (a1, b1, c1), None), 2
+        elif name in ("slt", "sltu") and a != 0:
+            name1, a1, b1, c1 = classify(MEM[index + 1])
+            if name1 in ("beq", "bne"): return (self._fused_compare_branch, (name == "sltu", a, b, c), (name1 == "beq", a1, b1, c1 * 4), None), 2
+        elif name in ("mult", "multu", "div", "divu"):
+            moves = []
+            for i in (index + 1, index + 2):
+                name1, a1, b1, c1 = classify(MEM[i])
+                if name1 not in ("mfhi", "mflo"): break
+                moves.append((a1, name1 == "mfhi"))
+                if a1 == 0: break # only the last instruction can write to the 0 register
+            if len(moves) == 1: return (self._fused_multiply_move, (name, b, c)) + moves[0], 2
+            if len(moves) == 2: return (self._fused_multiply_move_move, (name, b, c), moves[0], moves[1]), 3
+        return None
+    
     def load(self, code, offset = 0): # load binary code into memory
-        assert offset % 4 == 0, "Invalid offset - offset must be aligned to 32-bit word boundary"
-        offset //= 4 # get the offset in words
-        for i, word in enumerate(code_to_words(code)): self.MEM[i + offset] = word # copy the code into memory
-        self.registers[30] = 0x00000000
-        self.registers[31] = 0xFFFFFFFF
+        self.load_words(code_to_words(code), offset)
     
     def load_hex(self, hex_code, offset = 0): # load hex code into memory
+        self.load_words(hex_to_words(hex_code), offset)
+    
+    def load_file(self, path, offset = 0): # load the binary file at `path` into memory, memory-mapping it rather than reading it whole if it is large
+        self.load_words(code_to_words(read_code(path)), offset)
+    
+    def load_words(self, words, offset = 0): # load code that was already converted to words into memory
         assert offset % 4 == 0, "Invalid offset - offset must be aligned to 32-bit word boundary"
-        offset //= 4
-        for i, word in enumerate(hex_to_words(hex_code)): self.MEM[i + offset] = word # copy the code into memory
+        offset //= 4 # get the offset in words
+        self.MEM.write_words(offset, words) # copy the code into memory
+        self.invalidate_all()
         self.registers[30] = 0x00000000
         self.registers[31] = 0xFFFFFFFF
     
     def step(self):
         if self.PC == 0xFFFFFFFF: return False # jumped past end of memory, program ended
         assert self.PC % 4 == 0, "Program counter must be aligned to word boundaries"
-        instruction = self.MEM[self.PC // 4] if self.PC // 4 in self.MEM else 0
-        self.offset = self.PC
-        self.PC = normalize(self.PC + 4)
-        self.decode_execute(instruction)
+        if self.tracing: # tracing requires the full decoder, which can describe the instruction as it executes it
+            instruction = self.MEM[self.PC // 4]
+            self.offset = self.PC
+            self.PC = normalize(self.PC + 4)
+            self.decode_execute(instruction)
+        elif self.trace_buffer is not None: self.step_recorded()
+        else:
+            index = self.PC // 4
+            handler, a, b, c = self.decoded[index] if index in self.decoded else self.predecode(index)
+            self.offset = self.PC
+            self.PC = (self.PC + 4) & 0xFFFFFFFF
+            self.registers[0] = 0 # reset the 0 register
+            handler(a, b, c)
+        self.steps += 1
         return True
     
-    def run(self, offset = 0):
+    def step_recorded(self): # execute one instruction and record it in the trace buffer - the PC must already be checked as in `step`
+        index = self.PC // 4
+        handler, a, b, c = self.decoded[index] if index in self.decoded else self.predecode(index)
+        instruction = self.MEM[index]
+        self.offset = self.PC
+        self.PC = (self.PC + 4) & 0xFFFFFFFF
+        r = self.registers
+        r[0] = 0 # reset the 0 register
+        kind, x, y, z = TRACE_DESTINATIONS[instruction] if instruction in TRACE_DESTINATIONS else trace_destination(instruction)
+        if kind == "memory": # compute the address before executing, in case the instruction faults
+            address = normalize(r[x] + y)
+        try: handler(a, b, c)
+        except InputPending: raise # not a fault, the instruction runs again once input arrives
+        except BaseException:
+            self.trace_buffer.record(self.offset, instruction, DESTINATION_FAULT, 0) # the faulting instruction is the last record
+            raise
+        if kind == "register": self.trace_buffer.record(self.offset, instruction, x, r[x])
+        elif kind == "LO": self.trace_buffer.record(self.offset, instruction, DESTINATION_LO, self.LO)
+        elif kind == "memory": self.trace_buffer.record(self.offset, instruction, DESTINATION_MEMORY | (address >> 2), r[z])
+        else: self.trace_buffer.record(self.offset, instruction, DESTINATION_NONE, 0)
+    
+    def run(self, offset = 0, max_steps = None): # run the program starting at `offset`, see `resume`
         self.PC = offset
-        while self.step(): pass
+        return self.resume(max_steps)
+    
+    def resume(self, max_steps = None):
+        """
+        Run the program from the current PC until it jumps past the end of memory, or until `max_steps` instructions have been executed if `max_steps` is not `None`.
+
+        Returns `HALTED` if the program ended, or `STEP_LIMIT` if it ran out of steps. The number of executed instructions is added to `self.steps`, and buffered output is flushed before returning.
+        """
+        try:
+            if self.tracing or self.trace_buffer is not None: # traced path, the fast path below does no tracing work at all
+                for _ in (count() if max_steps is None else range(max_steps)):
+                    if not self.step(): break
+                return HALTED if self.PC == 0xFFFFFFFF else STEP_LIMIT
+            if self.profile is not None:
+                import profiler
+                return profiler.run(self, max_steps)
+            if self.compile_blocks:
+                import blocks
+                return blocks.run(self, max_steps)
+            return self.interpret(max_steps)
+        finally: self.output.flush()
+    
+    def run_slice(self, max_steps):
+        """
+        Run the program from the current PC for at most `max_steps` instructions, without ever waiting for input, so that many programs can take turns running in a single thread.
+
+        Returns `RUNNING` if the program can keep running, `HALTED` if it ended, `WAITING` if it tried to read input that hasn't arrived yet, or `FAULTED` if it raised an exception, which is then stored in `self.fault`.
+
+        Programs only wait for input if `self.input` raises `InputPending`, like `FeedInput` does. In that case, the PC is left at the `lw` instruction that read the input, so that calling `run_slice` again once more input has been fed in runs it again.
+        """
+        if self.fault is not None: return FAULTED
+        try: reason = self.resume(max_steps)
+        except InputPending:
+            self.PC = self.offset # run the load again next time
+            return WAITING
+        except Exception as e:
+            self.fault = e
+            return FAULTED
+        return HALTED if reason == HALTED else RUNNING
+    
+    def run_until(self, breakpoints = (), watchpoints = (), max_steps = None):
+        """
+        Run the program from the current PC until it is about to execute an instruction at an address in `breakpoints`, or just after it loads or stores memory in one of the `watchpoints`. Also stops like `resume` does.
+
+        Each watchpoint is a tuple `(start, end, access)`, which watches the byte addresses from `start` up to but not including `end`, for reads if `access` contains "r", and for writes if it contains "w".
+
+        The instruction at the current PC is always executed, even if there is a breakpoint there, so that the program can be continued after stopping at a breakpoint.
 
-def code_to_words(code):
+        Returns `BREAKPOINT`, `WATCHPOINT`, `HALTED`, or `STEP_LIMIT`. For `WATCHPOINT`, the address and the access ("r" or "w") that triggered it are stored in `self.watch_hit`.
+        """
+        reads = [(start, end) for start, end, access in watchpoints if "r" in access]
+        writes = [(start, end) for start, end, access in watchpoints if "w" in access]
+        watching = bool(reads or writes)
+        try:
+            if self.tracing or self.trace_buffer is not None: # traced path, one step at a time
+                for steps in (count() if max_steps is None else range(max_steps)):
+                    if self.PC == 0xFFFFFFFF: return HALTED
+                    if steps and self.PC in breakpoints: return BREAKPOINT
+                    assert self.PC % 4 == 0, "Program counter must be aligned to word boundaries"
+                    index = self.PC // 4
+                    hit = watching and self.watched_access(self.decoded[index] if index in self.decoded else self.predecode(index), reads, writes)
+                    self.step()
+                    if hit: return WATCHPOINT
+                return HALTED if self.PC == 0xFFFFFFFF else STEP_LIMIT
+            
+            # same as `interpret`, but with breakpoint and watchpoint checks
+            registers, decoded, predecode = self.registers, self.decoded, self.predecode
+            lw, sw = Mippit._lw, Mippit._sw
+            PC, steps, reason = self.PC, 0, None
+            try:
+                for steps in (count() if max_steps is None else range(max_steps)): # `steps` is the number of instructions executed so far
+                    if PC == 0xFFFFFFFF: break # jumped past end of memory, program ended
+                    if steps and PC in breakpoints:
+                        reason = BREAKPOINT
+                        break
+                    assert PC % 4 == 0, "Program counter must be aligned to word boundaries"
+                    index = PC >> 2
+                    entry = decoded[index] if index in decoded else predecode(index)
+                    handler, a, b, c = entry
+                    self.offset = PC
+                    self.PC = (PC + 4) & 0xFFFFFFFF
+                    registers[0] = 0 # reset the 0 register
+                    hit = watching and (handler.__func__ is lw or handler.__func__ is sw) and self.watched_access(entry, reads, writes)
+                    handler(a, b, c)
+                    PC = self.PC
+                    if hit:
+                        steps += 1
+                        reason = WATCHPOINT
+                        break
+                else: steps = max_steps # ran out of steps
+            finally: self.steps += steps
+            if reason is not None: return reason
+            return HALTED if PC == 0xFFFFFFFF else STEP_LIMIT
+        finally: self.output.flush()
+    
+    def watched_access(self, entry, reads, writes): # whether the predecoded instruction `entry` is about to access memory in the ranges `reads` or `writes`, setting `self.watch_hit` if so
+        handler, s, t, i = entry
+        if handler.__func__ is Mippit._lw: access, ranges = "r", reads
+        elif handler.__func__ is Mippit._sw: access, ranges = "w", writes
+        else: return False
+        address = (self.registers[s] + i) & 0xFFFFFFFF if s != 0 else i & 0xFFFFFFFF # the 0 register is reset before every instruction
+        for start, end in ranges:
+            if start <= address < end:
+                self.watch_hit = (address, access)
+                return True
+        return False
+    
+    def interpret(self, max_steps = None): # same as repeatedly calling `step` without tracing, but with the lookups hoisted out of the loop
+        if self.fusion:
+            if max_steps is None: return self.interpret_fused(None)
+            start_steps = self.steps
+            while True: # fused instructions run several instructions at once, so only allow as many dispatches as could fit in the steps that are left
+                remaining = max_steps - (self.steps - start_steps)
+                if remaining < MAX_FUSED_LENGTH: break
+                if self.interpret_fused(remaining // MAX_FUSED_LENGTH) == HALTED: return HALTED
+            max_steps = remaining # run the last few steps one instruction at a time
+        registers, decoded, predecode = self.registers, self.decoded, self.predecode
+        PC, steps = self.PC, 0
+        try:
+            for steps in (count() if max_steps is None else range(max_steps)): # `steps` is the number of instructions executed so far
+                if PC == 0xFFFFFFFF: break # jumped past end of memory, program ended
+                assert PC % 4 == 0, "Program counter must be aligned to word boundaries"
+                index = PC >> 2
+                handler, a, b, c = decoded[index] if index in decoded else predecode(index)
+                self.offset = PC
+                self.PC = (PC + 4) & 0xFFFFFFFF
+                registers[0] = 0 # reset the 0 register
+                handler(a, b, c)
+                PC = self.PC
+            else: steps = max_steps # ran out of steps
+        finally: self.steps += steps
+        return HALTED if PC == 0xFFFFFFFF else STEP_LIMIT
+
+    def interpret_fused(self, max_dispatches = None): # same as `interpret`, but using the fused instructions from `fuse`, running at most `max_dispatches` instructions or fused sequences
+        registers, fused, fuse = self.registers, self.fused, self.fuse
+        PC, dispatches = self.PC, 0
+        try:
+            for dispatches in (count() if max_dispatches is None else range(max_dispatches)): # fused instructions add their extra instructions to `self.steps` themselves
+                if PC == 0xFFFFFFFF: break # jumped past end of memory, program ended
+                assert PC % 4 == 0, "Program counter must be aligned to word boundaries"
+                index = PC >> 2
+                handler, a, b, c = fused[index] if index in fused else fuse(index)
+                self.offset = PC
+                self.PC = (PC + 4) & 0xFFFFFFFF
+                registers[0] = 0 # reset the 0 register
+                handler(a, b, c)
+                PC = self.PC
+            else: dispatches = max_dispatches # ran out of dispatches
+        finally: self.steps += dispatches
+        return HALTED if PC == 0xFFFFFFFF else STEP_LIMIT
+
+# maps the funct field of R-type instructions (opcode 0) to the instruction name and a mask of the bits that must be zero
+FUNCT_TABLE = {
+    0b100000: ("add",   0b00000000000000000000011111000000),
+    0b100010: ("sub",   0b00000000000000000000011111000000),
+    0b011000: ("mult",  0b00000000000000001111111111000000),
+    0b011001: ("multu", 0b00000000000000001111111111000000),
+    0b011010: ("div",   0b00000000000000001111111111000000),
+    0b011011: ("divu",  0b00000000000000001111111111000000),
+    0b010000: ("mfhi",  0b00000011111111110000011111000000),
+    0b010010: ("mflo",  0b00000011111111110000011111000000),
+    0b010100: ("lis",   0b00000011111111110000011111000000),
+    0b101010: ("slt",   0b00000000000000000000011111000000),
+    0b101011: ("sltu",  0b00000000000000000000011111000000),
+    0b001000: ("jr",    0b00000000000111111111111111000000),
+    0b001001: ("jalr",  0b00000000000111111111111111000000),
+}
+
+MMAP_THRESHOLD = 1 << 20 # binary files at least this many bytes long are memory-mapped by `read_code`
+MAX_FUSED_LENGTH = 3 # maximum number of instructions in a fused sequence, see `Mippit.fuse`
+MAX_FUSED_WORDS = 4 # maximum number of words in a fused sequence, including `lis` literals
+
+# maps the opcode field of I-type instructions to the instruction name
+OPCODE_TABLE = {
+    0b100011: "lw",
+    0b101011: "sw",
+    0b000100: "beq",
+    0b000101: "bne",
+}
+
+def multiply(operation, registers): # `(HI, LO)` after running `operation`, which is `(name, s, t)` for a `mult`, `multu`, `div`, or `divu` instruction
+    name, s, t = operation
+    a, b = registers[s], registers[t]
+    if name == "multu":
+        result = a * b
+        return (result >> 32) & 0xFFFFFFFF, result & 0xFFFFFFFF
+    if name == "divu": return a % b, a // b
+    if a & 0x80000000: a -= 0x100000000
+    if b & 0x80000000: b -= 0x100000000
+    if name == "mult":
+        result = a * b
+        return (result >> 32) & 0xFFFFFFFF, result & 0xFFFFFFFF
+    return a % b & 0xFFFFFFFF, a // b & 0xFFFFFFFF
+
+def classify(instruction): # returns `(name, d, s, t)` for R-type instructions, `(name, s, t, i)` for I-type instructions, and `(None, None, None, None)` for anything else
+    instruction = normalize(instruction)
+    opcode = instruction >> 26
+    if opcode == 0: # R-type instruction, the operation is given by the funct field
+        name, reserved = FUNCT_TABLE.get(instruction & 0b111111, (None, 0))
+        if name is None or instruction & reserved: return None, None, None, None # unknown funct, or bits that must be zero are set
+        return name, (instruction >> 11) & 0b11111, (instruction >> 21) & 0b11111, (instruction >> 16) & 0b11111
+    if opcode in OPCODE_TABLE: # I-type instruction
+        i = instruction & 0b1111111111111111
+        if i & 0x8000: i -= 0x10000 # make sure we interpret the value as a signed 16 bit integer
+        return OPCODE_TABLE[opcode], (instruction >> 21) & 0b11111, (instruction >> 16) & 0b11111, i
+    return None, None, None, None
+
+TRACE_DESTINATIONS = {} # mapping from instruction words to their trace destinations, see `trace_destination`
+def trace_destination(instruction): # returns `(kind, x, y, z)` describing what `instruction` modifies, for trace records
+    name, a, b, c = classify(instruction)
+    if name in ("add", "sub", "slt", "sltu", "mfhi", "mflo", "lis"): result = ("register", a, None, None) # register $d
+    elif name in ("mult", "multu", "div", "divu"): result = ("LO", None, None, None)
+    elif name == "lw": result = ("register", b, None, None) # register $t
+    elif name == "sw": result = ("memory", a, c, b) # address is $s + i, value is $t
+    elif name == "jalr": result = ("register", 31, None, None)
+    else: result = ("none", None, None, None)
+    TRACE_DESTINATIONS[instruction] = result
+    return result
+
+def code_to_words(code): # convert big-endian machine code (any bytes-like object) into an `array("I")` of unsigned 32-bit words, all at once
     assert len(code) % 4 == 0, "Invalid code length - machine code must be collection of 32-bit words"
-    import struct
-    return [struct.unpack(">i", code[i * 4:i * 4 + 4])[0] for i in range(0, len(code) // 4)] # load each 4 bytes as a big endian 32-bit integer
+    words = array("I")
+    words.frombytes(code)
+    if sys.byteorder == "little": words.byteswap() # `array` uses the native byte order
+    return words
 
 def hex_to_words(hex_code):
     assert len(hex_code) % 8 == 0, "Invalid code length - machine code must be collection of 32-bit words"
-    return [int(hex_code[i * 8:i * 8 + 8], 16) for i in range(0, len(hex_code) // 8)]
+    return code_to_words(bytes.fromhex(hex_code))
+
+def read_code(path): # contents of the binary file at `path`, memory-mapped rather than read if the file is large
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD: return f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays valid after the file is closed
+
+# maps instruction names to the format of their operands, given the values from `classify`
+OPERAND_FORMATS = {
+    "add": "${0}, ${1}, ${2}", "sub": "${0}, ${1}, ${2}", "slt": "${0}, ${1}, ${2}", "sltu": "${0}, ${1}, ${2}",
+    "mult": "${1}, ${2}", "multu": "${1}, ${2}", "div": "${1}, ${2}", "divu": "${1}, ${2}",
+    "mfhi": "${0}", "mflo": "${0}", "lis": "${0}",
+    "lw": "${1}, {2}(${0})", "sw": "${1}, {2}(${0})",
+    "beq": "${0}, ${1}, {2}", "bne": "${0}, ${1}, {2}",
+    "jr": "${1}", "jalr": "${1}",
+}
 
 def decode(instruction):
-    d, s, t = (instruction >> 11) & 0b11111, (instruction >> 21) & 0b11111, (instruction >> 16) & 0b11111
-    i = instruction & 0b1111111111111111
-    if i & 0x8000: i -= 0x10000 # make sure we interpret the value as a signed 16 bit integer
-    
-    if instruction & 0b11111100000000000000011111111111 == 0b00000000000000000000000000100000: # add (add)
-        return "add ${}, ${}, ${}".format(d, s, t)
-    if instruction & 0b11111100000000000000011111111111 == 0b00000000000000000000000000100010: # subtract (sub)
-        return "sub ${}, ${}, ${}".format(d, s, t)
-    if instruction & 0b11111100000000001111111111111111 == 0b00000000000000000000000000011000: # multiply (mult)
-        return "mult ${}, ${}".format(s, t)
-    if instruction & 0b11111100000000001111111111111111 == 0b00000000000000000000000000011001: # multiply unsigned (multu)
-        return "multu ${}, ${}".format(s, t)
-    if instruction & 0b11111100000000001111111111111111 == 0b00000000000000000000000000011010: # divide (div)
-        return "div ${}, ${}".format(s, t)
-    if instruction & 0b11111100000000001111111111111111 == 0b00000000000000000000000000011011: # divide unsigned (divu)
-        return "divu ${}, ${}".format(s, t)
-    if instruction & 0b11111111111111110000011111111111 == 0b00000000000000000000000000010000: # move from high/remainder (mfhi)
-        return "mfhi ${}".format(d)
-    if instruction & 0b11111111111111110000011111111111 == 0b00000000000000000000000000010010: # move from low/quotient (mflo)
-        return "mflo ${}".format(d)
-    if instruction & 0b11111111111111110000011111111111 == 0b00000000000000000000000000010100: # load immediate and skip (lis)
-        return "lis ${}".format(d)
-    if instruction & 0b11111100000000000000000000000000 == 0b10001100000000000000000000000000: # load word (lw)
-        return "lw ${}, {}(${})".format(t, i, s)
-    if instruction & 0b11111100000000000000000000000000 == 0b10101100000000000000000000000000: # store word (sw)
-        return "sw ${}, {}(${})".format(t, i, s)
-    if instruction & 0b11111100000000000000011111111111 == 0b00000000000000000000000000101010: # set less than (slt)
-        return "slt ${}, ${}, ${}".format(d, s, t)
-    if instruction & 0b11111100000000000000011111111111 == 0b00000000000000000000000000101011: # set less than unsigned (sltu)
-        return "sltu ${}, ${}, ${}".format(d, s, t)
-    if instruction & 0b11111100000000000000000000000000 == 0b00010000000000000000000000000000: # branch on equal (beq)
-        return "beq ${}, ${}, {}".format(s, t, i)
-    if instruction & 0b11111100000000000000000000000000 == 0b00010100000000000000000000000000: # branch on not equal (bne)
-        return "bne ${}, ${}, {}".format(s, t, i)
-    if instruction & 0b11111100000111111111111111111111 == 0b00000000000000000000000000001000: # jump register (jr)
-        return "jr ${}".format(s)
-    if instruction & 0b11111100000111111111111111111111 == 0b00000000000000000000000000001001: # jump and link register (jalr)
-        return "jalr ${}".format(s)
-    return ".word 0x{:X}".format(instruction)
-
-if __name__ == "__main__":
-    mips = Mippit()
-    mips.load_hex("00201820004008200060102003e00008")
-    mips.registers[1], mips.registers[2] = 3, 4
-    mips.run()
-    print(mips.registers)
+    name, a, b, c = classify(instruction)
+    if name is None: return ".word 0x{:X}".format(normalize(instruction))
+    return name + " " + OPERAND_FORMATS[name].format(a, b, c)
+
+if __name__ == "__main__": # `runner.py` is the command line interface, and starts faster when run directly, since this module is then loaded from cached bytecode
+    import runpy
+    runpy.run_module("runner", run_name="__main__")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Execution profiler for Mippit.
+
+Counts how many times each instruction is executed, how many times each basic block is entered, and how many instructions are executed under each call stack, where calls are `jalr` instructions and returns are the matching `jr $31` instructions. From those, `Profile` can produce a text report with the instruction mix, the hottest instructions and blocks, and the call graph, as well as collapsed stacks for flamegraph tools such as `flamegraph.pl`.
+
+To use it, set `profile` on a `Mippit` before calling `run`:
+
+    mips = mippits.Mippit()
+    mips.load(code)
+    mips.profile = profiler.Profile()
+    mips.run()
+    print(mips.profile.report(mips))
+
+Profiling uses its own interpreter loop, so it doesn't slow down programs that aren't being profiled.
+"""
+
+import sys, getopt
+from itertools import count
+
+import mippits
+
+class Profile:
+    def __init__(self):
+        self.steps = 0 # number of instructions profiled so far
+        self.counts = {} # mapping from instruction addresses to the number of times they were executed
+        self.block_entries = {} # mapping from basic block start addresses to the number of times the block was entered
+        self.calls = {} # mapping from `(caller, call site, callee)` to the number of times the `jalr` at the call site called the callee
+        self.stack = [] # list of `(function address, return address)` for each call that hasn't returned yet
+        self.stack_steps = {} # mapping from call stacks (tuples of function addresses) to the number of instructions executed with exactly that stack
+        self.root = None # address profiling started at, which is the bottom of every call stack
+        self.stack_changed = 0 # value of `self.steps` when the call stack last changed
+
+    def stack_key(self): return (self.root,) + tuple(function for function, _ in self.stack)
+    def account(self): # add the instructions executed since the call stack last changed to the current call stack
+        key = self.stack_key()
+        self.stack_steps[key] = self.stack_steps.get(key, 0) + self.steps - self.stack_changed
+        self.stack_changed = self.steps
+
+    def call(self, site, target, return_address): # the `jalr` at `site` jumped to `target`
+        self.account()
+        key = (self.stack[-1][0] if self.stack else self.root, site, target)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.stack.append((target, return_address))
+
+    def ret(self, target): # a `jr $31` jumped to `target`, which is only a return if it goes back to the most recent call
+        if self.stack and self.stack[-1][1] == target:
+            self.account()
+            self.stack.pop()
+
+    def instruction_mix(self, mips): # list of `(mnemonic, count)`, most executed first, using the instructions currently in memory
+        mix = {}
+        for address, executed in self.counts.items():
+            mnemonic = mippits.decode(mips.MEM[address // 4]).split(" ", 1)[0]
+            mix[mnemonic] = mix.get(mnemonic, 0) + executed
+        return sorted(mix.items(), key=lambda item: (-item[1], item[0]))
+
+    def blocks(self, mips):
+        """
+        Returns a list of `(start, end, entries, instructions)` for each basic block that was entered, most instructions executed first.
+
+        A block starts at the first instruction executed and after each `beq`, `bne`, `jr`, or `jalr`, and continues up to and including the next one of those. `end` is the address of the last instruction in the block, and `instructions` is the number of instructions executed in the block, assuming every entry ran to the end of the block.
+        """
+        result = []
+        for start, entries in self.block_entries.items():
+            if start == 0xFFFFFFFF: continue # the program ended
+            address, length = start, 0
+            while True:
+                name = mippits.classify(mips.MEM[address // 4])[0]
+                length += 1
+                if name in ("beq", "bne", "jr", "jalr") or name is None or address >= 0xFFFFFFFC: break
+                address += 8 if name == "lis" else 4 # skip over the literal word of `lis`
+            result.append((start, address, entries, entries * length))
+        return sorted(result, key=lambda block: (-block[3], block[0]))
+
+    def functions(self):
+        """
+        Returns a mapping from function addresses to `(inclusive, exclusive)` instruction counts, where the inclusive count includes the instructions executed by the functions it called.
+
+        The function at the bottom of every stack is the address profiling started at.
+        """
+        result = {}
+        for stack, steps in self.stack_steps.items():
+            for function in set(stack):
+                inclusive, exclusive = result.get(function, (0, 0))
+                result[function] = (inclusive + steps, exclusive + (steps if function == stack[-1] else 0))
+        return result
+
+    def collapsed(self): # yields lines of collapsed stacks for flamegraph tools, one per call stack, with the instructions executed with that stack
+        for stack, steps in sorted(self.stack_steps.items()):
+            if steps: yield "{} {}".format(";".join("{:=#010x}".format(function) for function in stack), steps)
+
+    def report(self, mips, top = 20): # text report of the profile, showing the `top` entries of each table
+        total = max(self.steps, 1)
+        lines = ["Instructions executed: {}".format(self.steps), "", "Instruction mix:"]
+        for mnemonic, executed in self.instruction_mix(mips):
+            lines.append("    {:<6} {:>12} {:6.2f}%".format(mnemonic, executed, 100 * executed / total))
+
+        lines += ["", "Hottest instructions:"]
+        for address, executed in sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            lines.append("    {:=#010x} {:>12} {:6.2f}%  {}".format(address, executed, 100 * executed / total, mippits.decode(mips.MEM[address // 4])))
+
+        lines += ["", "Hottest blocks:"]
+        for start, end, entries, instructions in self.blocks(mips)[:top]:
+            lines.append("    {:=#010x}-{:=#010x} entered {:>10} times, {:>12} instructions {:6.2f}%".format(start, end, entries, instructions, 100 * instructions / total))
+
+        lines += ["", "Functions (inclusive, exclusive instructions):"]
+        for function, (inclusive, exclusive) in sorted(self.functions().items(), key=lambda item: (-item[1][0], item[0]))[:top]:
+            lines.append("    {:=#010x} {:>12} {:6.2f}% {:>12} {:6.2f}%".format(function, inclusive, 100 * inclusive / total, exclusive, 100 * exclusive / total))
+
+        lines += ["", "Call graph:"]
+        for (caller, site, callee), calls in sorted(self.calls.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            lines.append("    {:=#010x} -> {:=#010x} {:>12} calls from {:=#010x}".format(caller, callee, calls, site))
+        return "\n".join(lines) + "\n"
+
+def run(mips, max_steps = None): # same as `Mippit.interpret`, but records execution counts into `mips.profile`
+    profile = mips.profile
+    registers, decoded, predecode = mips.registers, mips.decoded, mips.predecode
+    counts, block_entries = profile.counts, profile.block_entries
+    jr, jalr = mippits.Mippit._jr, mippits.Mippit._jalr
+    control = {mippits.Mippit._beq, mippits.Mippit._bne, jr, jalr} # instructions that end a basic block
+    PC, steps, start_steps = mips.PC, 0, profile.steps
+    if profile.root is None: # first run, the program starts in a new block
+        profile.root = PC
+        block_entries[PC] = 1
+    try:
+        for steps in (count() if max_steps is None else range(max_steps)): # `steps` is the number of instructions executed so far
+            if PC == 0xFFFFFFFF: break # jumped past end of memory, program ended
+            assert PC % 4 == 0, "Program counter must be aligned to word boundaries"
+            index = PC >> 2
+            handler, a, b, c = decoded[index] if index in decoded else predecode(index)
+            mips.offset = PC
+            mips.PC = (PC + 4) & 0xFFFFFFFF
+            registers[0] = 0 # reset the 0 register
+            handler(a, b, c)
+            counts[PC] = counts.get(PC, 0) + 1
+            function = handler.__func__
+            if function in control:
+                target = mips.PC
+                block_entries[target] = block_entries.get(target, 0) + 1
+                if function is jalr:
+                    profile.steps = start_steps + steps + 1
+                    profile.call(PC, target, (PC + 4) & 0xFFFFFFFF)
+                elif function is jr and b == 31:
+                    profile.steps = start_steps + steps + 1
+                    profile.ret(target)
+            PC = mips.PC
+        else: steps = max_steps # ran out of steps
+    finally:
+        mips.steps += steps
+        profile.steps = start_steps + steps
+        profile.account()
+    return mippits.HALTED if PC == 0xFFFFFFFF else mippits.STEP_LIMIT
+
+def print_help():
+    print("{} --help".format(sys.argv[0]))
+    print("    Shows this help message.")
+    print()
+    print("{} [--offset=o] [--max-steps=n] [--top=n] [--flamegraph=stacks_file] file".format(sys.argv[0]))
+    print("    Runs `file` with profiling enabled, then prints a profile report to standard error.")
+    print("    If `--offset` is specified, the code is loaded at address `o` (defaulting to 0) and execution begins there.")
+    print("    `--max-steps` limits the number of instructions executed, and `--top` sets the number of entries in each table of the report (defaulting to 20).")
+    print("    If `--flamegraph` is specified, collapsed stacks are written to `stacks_file`, for use with tools like `flamegraph.pl`.")
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "offset=", "max-steps=", "top=", "flamegraph="])
+    except getopt.GetoptError as err:
+        print(err)
+        print()
+        print_help()
+        sys.exit(2)
+    offset, max_steps, top, flamegraph_path = 0, None, 20, None
+    for opt, arg in opts:
+        if opt == "--help":
+            print_help()
+            sys.exit()
+        elif opt == "--offset":
+            offset = int(arg, 0)
+            assert offset % 4 == 0, "Value must be a multiple of 4"
+        elif opt == "--max-steps": max_steps = int(arg)
+        elif opt == "--top": top = int(arg)
+        elif opt == "--flamegraph": flamegraph_path = arg
+    if len(args) != 1:
+        print_help()
+        sys.exit(2)
+
+    mips = mippits.Mippit()
+    mips.load_file(args[0], offset)
+    mips.profile = Profile()
+    mips.run(offset, max_steps)
+    print(mips.profile.report(mips, top), end="", file=sys.stderr) # standard output belongs to the program
+    if flamegraph_path is not None:
+        with open(flamegraph_path, "w") as f:
+            for line in mips.profile.collapsed(): f.write(line + "\n")
@@ -0,0 +1,167 @@
+"""
+Record/replay for Mippit, so that programs can be run backwards in the debugger.
+
+A `Recording` logs every value the program reads from 0xFFFF0004, and takes a checkpoint of the registers and memory every `interval` instructions. Since the program is otherwise deterministic, any earlier step can be reached again by restoring the nearest checkpoint before it and running forward from there, reading the logged input rather than the real input device, and hiding output that was already written:
+
+    mips = mippits.Mippit()
+    mips.load(code)
+    recording = replay.Recording(mips)
+    recording.run_until(mips, breakpoints)
+    recording.reverse_step(mips) # back to just before the last instruction
+
+Checkpoints share unchanged memory pages with each other and with the virtual machine, see `Mippit.snapshot`. There are never more than `max_checkpoints` of them - when there would be more, every other one is dropped and the interval doubles, so memory use stays bounded no matter how long the program runs, and going back any number of steps re-executes fewer than `interval` instructions.
+"""
+
+from array import array
+
+import mippits
+
+class RecordedInput: # input device that logs every value read from `device`, and reads from the log instead when the program reads the same input again after going back in time
+    def __init__(self, device):
+        self.device = device
+        self.log = array("I") # every value read from `device` so far
+        self.position = 0 # number of values the program has read so far
+
+    @property
+    def interactive(self): return self.device.interactive and self.position >= len(self.log) # logged input doesn't need any waiting
+
+    def read(self):
+        if self.position < len(self.log): value = self.log[self.position]
+        else:
+            value = self.device.read()
+            self.log.append(value)
+        self.position += 1
+        return value
+
+class RecordedOutput: # output device that writes to `device`, except for output that was already written before going back in time
+    def __init__(self, device):
+        self.device = device
+        self.position = 0 # number of bytes the program has written so far
+        self.written = 0 # number of bytes actually written to `device`
+
+    def write(self, value):
+        if self.position >= self.written:
+            self.device.write(value)
+            self.written += 1
+        self.position += 1
+
+    def flush(self): self.device.flush()
+
+class Recording:
+    def __init__(self, mips, interval = 100000, max_checkpoints = 64):
+        """
+        Starts recording `mips` from its current state, replacing its input and output devices with ones that log input and hide repeated output.
+
+        A checkpoint is taken every `interval` instructions, but there are never more than `max_checkpoints` checkpoints.
+        """
+        self.input, self.output = RecordedInput(mips.input), RecordedOutput(mips.output)
+        mips.input, mips.output = self.input, self.output
+        self.interval, self.max_checkpoints = interval, max_checkpoints
+        self.checkpoints = [] # list of `(Snapshot, input position, output position)`, in order of step count
+        self.branches = [] # list of `(steps, output position)` for each time the state was changed by hand, in order of step count, see `branch`
+        self.checkpoint(mips)
+
+    def save(self, mips): return (mips.snapshot(), self.input.position, self.output.position) # checkpoint of the current state, see `restore`
+
+    def checkpoint(self, mips): # add a checkpoint of the current state, thinning out the checkpoints if there are too many
+        self.checkpoints.append(self.save(mips))
+        if len(self.checkpoints) > self.max_checkpoints:
+            branch_steps = {steps for steps, _ in self.branches}
+            self.checkpoints = [checkpoint for i, checkpoint in enumerate(self.checkpoints) if i % 2 == 0 or checkpoint[0].steps in branch_steps] # always keeps the first checkpoint, and the ones with changes made by hand, which can't be reached by running forward from an earlier one
+            self.interval *= 2
+
+    def load(self, mips, checkpoint): # go back to the state in `checkpoint`, from `save`
+        snapshot, self.input.position, self.output.position = checkpoint
+        mips.restore(snapshot)
+
+    def restore(self, mips, checkpoint):
+        """
+        Go back to the state in `checkpoint`, from `save`, and forget everything recorded after it, since the state might have been changed by hand since `checkpoint` was saved.
+
+        Input that was read after `checkpoint` is read again in the same order, but output that was written after it is written again.
+        """
+        self.load(mips, checkpoint)
+        self.branch(mips)
+
+    def branch(self, mips): # forget everything recorded after the current state, for when the state was changed by hand
+        self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint[0].steps < mips.steps]
+        self.branches = [branch for branch in self.branches if branch[0] < mips.steps]
+        self.branches.append((mips.steps, self.output.position))
+        self.output.written = self.output.position
+        self.checkpoint(mips)
+
+    def discard_after(self, steps): # forget everything recorded after `steps` if it is before a change made by hand, since running forward from there follows the timeline without that change
+        later = [branch for branch in self.branches if branch[0] > steps]
+        if not later: return
+        self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint[0].steps <= steps]
+        self.branches = [branch for branch in self.branches if branch[0] <= steps]
+        self.output.written = min(self.output.written, later[0][1]) # output after the first discarded change wasn't written by this timeline
+
+    def start(self): return self.checkpoints[0][0].steps # step count the recording starts at
+
+    def run_until(self, mips, breakpoints = (), watchpoints = (), max_steps = None):
+        """
+        Same as `Mippit.run_until`, but takes checkpoints along the way.
+
+        When running over steps that were already recorded, the logged input is read again, and output that was already written is hidden.
+        """
+        start_steps = mips.steps
+        while True:
+            latest = self.checkpoints[-1][0].steps
+            if mips.steps >= latest + self.interval:
+                self.checkpoint(mips)
+                latest = mips.steps
+            limit = latest + self.interval - mips.steps
+            if max_steps is not None: limit = min(limit, start_steps + max_steps - mips.steps)
+            reason = mips.run_until(breakpoints, watchpoints, limit)
+            if reason != mippits.STEP_LIMIT: return reason
+            if max_steps is not None and mips.steps - start_steps >= max_steps: return mippits.STEP_LIMIT
+            if mips.PC in breakpoints: return mippits.BREAKPOINT # `Mippit.run_until` doesn't stop at the first instruction, so check before continuing
+
+    def replay(self, mips, steps): # run `steps` instructions without stopping or tracing, to get back to a recorded step
+        tracing, mips.tracing = mips.tracing, False
+        try: mips.resume(steps)
+        finally: mips.tracing = tracing
+
+    def seek(self, mips, steps):
+        """
+        Go to the state the program was in after executing `steps` instructions, by restoring the nearest checkpoint before it and running forward from there.
+
+        `steps` can't be before the start of the recording. Going back before a change made by hand (see `branch`) forgets that change and everything recorded after it, since running forward again follows the program without it.
+        """
+        assert steps >= self.start(), "Can't go back before the start of the recording"
+        self.discard_after(steps)
+        checkpoint = next(checkpoint for checkpoint in reversed(self.checkpoints) if checkpoint[0].steps <= steps)
+        self.load(mips, checkpoint)
+        self.replay(mips, steps - mips.steps)
+
+    def reverse_step(self, mips, steps = 1): # go back `steps` instructions, or to the start of the recording, returning whether it went back as far as requested
+        target = mips.steps - steps
+        self.seek(mips, max(target, self.start()))
+        return mips.steps == target
+
+    def reverse_continue(self, mips, breakpoints = (), watchpoints = ()):
+        """
+        Go back to the last time the program stopped at one of `breakpoints` or `watchpoints`, like `Mippit.run_until` would stop when running forward, or to the start of the recording if there is no such time.
+
+        Returns `BREAKPOINT` or `WATCHPOINT` (setting `mips.watch_hit`) for the stop it went back to, or `None` if it went back to the start of the recording.
+        """
+        end = mips.steps
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint[0].steps >= end: continue
+            self.load(mips, checkpoint)
+            stop = (mips.steps, mippits.BREAKPOINT, None) if mips.PC in breakpoints else None # last stop found in this part of the recording
+            tracing, mips.tracing = mips.tracing, False
+            try:
+                while mips.steps < end:
+                    reason = mips.run_until(breakpoints, watchpoints, end - mips.steps)
+                    if reason == mippits.HALTED: break
+                    if reason != mippits.STEP_LIMIT and mips.steps < end: stop = (mips.steps, reason, mips.watch_hit)
+            finally: mips.tracing = tracing
+            if stop is not None:
+                steps, reason, mips.watch_hit = stop
+                self.seek(mips, steps)
+                return reason
+            end = checkpoint[0].steps
+        self.seek(mips, self.start())
+        return None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import sys, time
+
+import mippits
+
+def print_help():
+    print("{} --help".format(sys.argv[0]))
+    print("    Shows this help message.")
+    print()
+    print("{} [--twoints=a,b | --array=v_1,...,v_n] [--max-steps=n] [--offset=o] [--input=input_file] [--blocks] [--fusion] file".format(sys.argv[0]))
+    print("    Runs `file` without any interaction, then prints the registers, the number of instructions executed, and the run time to standard error.")
+    print("    If `--twoints` is specified, $1 and $2 are set to `a` and `b` before running, like the CS241 `twoints` loader.")
+    print("    If `--array` is specified, the integers `v_1` to `v_n` are stored in memory just after the program, and $1 and $2 are set to their address and `n` before running, like the CS241 `array` loader.")
+    print("    If `--offset` is specified, the code is loaded at address `o` (defaulting to 0) and execution begins there.")
+    print("    If `--input` is specified, the program reads its input from `input_file` rather than standard input.")
+    print("    `--max-steps` limits the number of instructions executed. If `--blocks` is specified, the program is run with the basic block compiler, and if `--fusion` is specified, common instruction sequences are run as single fused instructions.")
+    print("    Exits with status 1 if the program raised an exception or ran out of steps.")
+
+def parse_integers(value): return [mippits.normalize(int(x, 0)) for x in value.split(",")] if value else []
+
+if __name__ == "__main__":
+    # arguments are parsed by hand, since importing `getopt` takes longer than everything else this script does before running the program
+    options, args = {}, []
+    for arg in sys.argv[1:]:
+        if not arg.startswith("--"): args.append(arg)
+        else:
+            name, _, value = arg[2:].partition("=")
+            if name not in ("help", "twoints", "array", "max-steps", "offset", "input", "blocks", "fusion"):
+                print("option --{} not recognized".format(name))
+                print()
+                print_help()
+                sys.exit(2)
+            options[name] = value
+    if "help" in options:
+        print_help()
+        sys.exit()
+    if len(args) != 1 or ("twoints" in options and "array" in options):
+        print_help()
+        sys.exit(2)
+    try:
+        twoints = parse_integers(options["twoints"]) if "twoints" in options else None
+        assert twoints is None or len(twoints) == 2, "`--twoints` needs exactly two integers"
+        array = parse_integers(options["array"]) if "array" in options else None
+        max_steps = int(options["max-steps"]) if "max-steps" in options else None
+        offset = int(options.get("offset", "0"), 0)
+        assert offset % 4 == 0, "Value must be a multiple of 4"
+    except (ValueError, AssertionError) as e:
+        print(e)
+        print()
+        print_help()
+        sys.exit(2)
+
+    try: words = mippits.code_to_words(mippits.read_code(args[0]))
+    except OSError:
+        print("Could not read file: {}".format(args[0]), file=sys.stderr)
+        sys.exit(1)
+    mips = mippits.Mippit()
+    mips.load_words(words, offset)
+    if twoints is not None: mips.registers[1], mips.registers[2] = twoints
+    if array is not None:
+        address = offset + len(words) * 4 # just after the program
+        mips.write_words(address // 4, array)
+        mips.registers[1], mips.registers[2] = address, len(array)
+    if "input" in options:
+        try: mips.input = mippits.StreamInput(open(options["input"], "rb"))
+        except OSError:
+            print("Could not read input file: {}".format(options["input"]), file=sys.stderr)
+            sys.exit(1)
+    mips.compile_blocks, mips.fusion = "blocks" in options, "fusion" in options
+
+    start = time.perf_counter()
+    try: reason = mips.run(offset, max_steps)
+    except Exception as e:
+        reason = "error"
+        mips.output.flush()
+        print("Program raised {} at {:=#010x}: {}".format(type(e).__name__, mips.offset, e), file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    if reason == mippits.HALTED: print("MIPS program completed normally.", file=sys.stderr)
+    elif reason == mippits.STEP_LIMIT: print("MIPS program stopped after reaching the step limit.", file=sys.stderr)
+    for register in range(1, 32):
+        print("${:02} = {:=#010x}".format(register, mips.registers[register]), end="\n" if register % 4 == 0 or register == 31 else "   ", file=sys.stderr)
+    print("Steps: {}, time: {:.6f}s".format(mips.steps, elapsed), file=sys.stderr)
+    sys.exit(0 if reason == mippits.HALTED else 1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Differential tests for the execution engines.
+
+Every engine (the interpreter, the basic block compiler, fused instructions, the traced path, `run_until`, and the profiler) must give exactly the same results as running `Mippit.decode_execute` one instruction at a time. These tests generate random programs that lean towards the instruction sequences CS241 compilers emit, along with self-modifying stores, MMIO, and faults like misaligned accesses, unknown instructions, and division by zero, then run each one with every engine and compare the registers, HI/LO, PC, memory, step count, exception type, and output.
+
+Run with `./test_engines.py` or `python -m unittest test_engines`.
+"""
+
+import random, unittest
+
+import mippits, profiler
+
+PROGRAMS = 400 # number of random programs to run with each engine
+PROGRAM_WORDS = 64 # length of each random program in words
+MAX_STEPS = 400 # maximum number of instructions to run each program for
+REGISTERS = (0, 1, 2, 3, 4, 5, 30, 31) # registers the generated instructions use
+VALUES = (0, 1, 2, 3, 4, 8, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFF, 0xFFFF000C, 0xFFFF0004) # interesting initial register values and `lis` literals
+
+def r_type(d, s, t, funct): return (s << 21) | (t << 16) | (d << 11) | funct
+def i_type(opcode, s, t, i): return (opcode << 26) | (s << 21) | (t << 16) | (i & 0xFFFF)
+ADD, SUB, MULT, MULTU, DIV, DIVU, MFHI, MFLO, LIS, SLT, SLTU, JR, JALR = 0x20, 0x22, 0x18, 0x19, 0x1A, 0x1B, 0x10, 0x12, 0x14, 0x2A, 0x2B, 0x08, 0x09 # funct fields
+LW, SW, BEQ, BNE = 0x23, 0x2B, 0x04, 0x05 # opcodes
+
+def random_program(rng, length = PROGRAM_WORDS): # list of `length` words of code, mostly made up of the instruction sequences that fused instructions and compiled blocks handle specially
+    words = []
+    register = lambda: rng.choice(REGISTERS)
+    while len(words) < length:
+        kind = rng.randrange(20)
+        if kind == 0: # call through a register loaded with `lis`, sometimes to the end of the program or a misaligned address
+            x = rng.choice((3, 8, 0))
+            words += [r_type(x, 0, 0, LIS), rng.choice((4 * rng.randrange(length), 4 * rng.randrange(length), 0xFFFFFFFF, 2)), r_type(0, x, 0, JALR)]
+        elif kind == 1: # push onto the stack
+            x = rng.choice((4, 31, 0))
+            words += [i_type(SW, rng.choice((30, 1)), register(), rng.choice((-4, 0, 2))), r_type(x, 0, 0, LIS), rng.choice((4, 8)), r_type(rng.choice((30, 0)), 30, x, rng.choice((ADD, SUB)))]
+        elif kind == 2: # pop off the stack
+            x = rng.choice((4, 31, 0))
+            words += [r_type(x, 0, 0, LIS), rng.choice((4, 8)), r_type(rng.choice((30, 0)), 30, x, rng.choice((ADD, SUB))), i_type(LW, rng.choice((30, 0)), register(), rng.choice((-4, 0)))]
+        elif kind == 3: # store or load next to arithmetic
+            words += [i_type(SW, rng.choice((30, 30, 30, 1)), register(), rng.choice((-4, 0, 4))), r_type(register(), register(), register(), rng.choice((ADD, SUB)))]
+            words += [r_type(register(), register(), register(), rng.choice((ADD, SUB))), i_type(LW, rng.choice((30, 1, 0)), register(), rng.choice((-4, 0, 4)))]
+        elif kind == 4: # compare and branch
+            words += [r_type(register(), register(), register(), rng.choice((SLT, SLTU))), i_type(rng.choice((BEQ, BNE)), register(), register(), rng.randrange(-8, 8))]
+        elif kind == 5: # multiply or divide, then move the results
+            words.append(r_type(0, register(), register(), rng.choice((MULT, MULTU, DIV, DIVU))))
+            words += [r_type(register(), 0, 0, rng.choice((MFHI, MFLO))) for _ in range(rng.randrange(1, 3))]
+        elif kind == 6: # reading input or writing output
+            words += [r_type(5, 0, 0, LIS), rng.choice((0xFFFF000C, 0xFFFF0004)), i_type(rng.choice((LW, SW)), 5, register(), 0)]
+        elif kind == 7: words += [r_type(register(), 0, 0, LIS), rng.choice(VALUES)]
+        elif kind == 8: words.append(r_type(0, rng.choice((1, 31, 31, 2)), 0, rng.choice((JR, JALR)))) # usually to an address in the program or the end of the program
+        elif kind == 9: words.append(i_type(rng.choice((BEQ, BNE)), register(), register(), rng.randrange(-8, 8)))
+        elif kind == 10: words.append(rng.randrange(1 << 32)) # data, usually an unknown instruction
+        else: words.append(r_type(register(), register(), register(), rng.choice((ADD, SUB, SLT, SLTU))))
+    return words[:length]
+
+def load_program(seed): # new `Mippit` with the random program for `seed` loaded and its registers, input, and output set up
+    rng = random.Random(seed)
+    mips = mippits.Mippit()
+    mips.load_words(random_program(rng))
+    for register in range(1, 30): mips.registers[register] = rng.choice(VALUES + (-1,)) # registers set through the API aren't necessarily normalized
+    mips.registers[1] = 4 * rng.randrange(PROGRAM_WORDS) # an address in the program, for self-modifying loads and stores
+    mips.registers[30] = 4 * rng.randrange(PROGRAM_WORDS - 8, PROGRAM_WORDS + 32) # the stack is just after the program, and sometimes grows down into it
+    mips.input = mippits.BytesInput(bytes(rng.randrange(256) for _ in range(rng.randrange(4))))
+    mips.output = mippits.BytesOutput()
+    return mips
+
+def run_reference(mips, max_steps): # run with `decode_execute`, one instruction at a time, like `step` does when tracing
+    for _ in range(max_steps):
+        if mips.PC == 0xFFFFFFFF: break
+        assert mips.PC % 4 == 0, "Program counter must be aligned to word boundaries"
+        instruction = mips.MEM[mips.PC // 4]
+        mips.offset = mips.PC
+        mips.PC = mippits.normalize(mips.PC + 4)
+        mips.decode_execute(instruction)
+        mips.steps += 1
+
+def run_sliced(mips, max_steps, rng): # run in randomly sized pieces, so that step limits fall everywhere, including in the middle of blocks and fused sequences
+    mips.PC = 0
+    while mips.steps < max_steps:
+        if mips.resume(min(rng.randrange(1, 12), max_steps - mips.steps)) == mippits.HALTED: break
+
+def set_attributes(mips, attributes): # set `attributes` on `mips`, calling the ones that are functions to get a fresh value for each run, so that no state carries over from one program to the next
+    for attribute, value in attributes.items(): setattr(mips, attribute, value() if callable(value) else value)
+
+def enable(**attributes): # engine that sets `attributes` on the virtual machine, then runs it
+    def run(mips, max_steps, rng):
+        set_attributes(mips, attributes)
+        mips.run(0, max_steps)
+    return run
+
+def enable_sliced(**attributes): # engine that sets `attributes` on the virtual machine, then runs it with `run_sliced`
+    def run(mips, max_steps, rng):
+        set_attributes(mips, attributes)
+        run_sliced(mips, max_steps, rng)
+    return run
+
+def run_until(mips, max_steps, rng):
+    mips.PC = 0
+    mips.run_until((), (), max_steps)
+
+ENGINES = {
+    "interpret": enable(),
+    "blocks": enable(compile_blocks=True),
+    "fused": enable(fusion=True),
+    "traced": enable(trace_buffer=lambda: mippits.TraceBuffer(16)),
+    "profiled": enable(profile=profiler.Profile),
+    "run_until": run_until,
+    "sliced interpret": enable_sliced(),
+    "sliced blocks": enable_sliced(compile_blocks=True),
+    "sliced fused": enable_sliced(fusion=True),
+}
+
+def outcome(mips, run, max_steps, rng): # everything about running `mips` with `run` that the engines must agree on
+    try:
+        run(mips, max_steps, rng)
+        exception = None
+    except Exception as e: exception = type(e).__name__
+    memory = {index: value for index, value in mips.MEM.items()}
+    return {"exception": exception, "registers": list(mips.registers[1:]), "HI": mips.HI, "LO": mips.LO, "PC": mips.PC, "offset": mips.offset, "steps": mips.steps, "memory": memory, "output": mips.output.getvalue()}
+
+class TestEngines(unittest.TestCase):
+    def test_engines_match_decode_execute(self):
+        for seed in range(PROGRAMS):
+            max_steps = random.Random(seed).randrange(1, MAX_STEPS)
+            expected = outcome(load_program(seed), lambda mips, max_steps, rng: run_reference(mips, max_steps), max_steps, None)
+            for name, run in ENGINES.items():
+                with self.subTest(seed=seed, engine=name):
+                    self.assertEqual(outcome(load_program(seed), run, max_steps, random.Random(seed)), expected)
+
+    def test_programs_exercise_engines(self): # make sure the random programs actually reach the code paths being compared
+        exceptions, fused, outputs = [], 0, 0
+        for seed in range(PROGRAMS):
+            mips = load_program(seed)
+            result = outcome(mips, enable(fusion=True), MAX_STEPS, None)
+            exceptions.append(result["exception"])
+            fused += sum(1 for handler, _, _, _ in mips.fused.values() if handler.__name__.startswith("_fused_"))
+            outputs += bool(result["output"])
+        self.assertLessEqual({None, "AssertionError", "ValueError", "ZeroDivisionError"}, set(exceptions))
+        self.assertGreater(exceptions.count(None), PROGRAMS // 5) # enough programs run until they end or run out of steps
+        self.assertGreater(fused, PROGRAMS)
+        self.assertGreater(outputs, PROGRAMS // 40)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Tests for record/replay in `replay.py`.
+
+Going back in time with a `Recording` must always land in exactly the state the program was in when it ran forward to that step, including after the state was changed by hand with `Recording.branch` and after checkpoints were thinned out, and output must never be written twice or lost. These tests run the benchmark programs forward, go back and forth, and compare the registers, HI/LO, PC, memory, step count, and output with runs that never went back.
+
+Run with `./test_replay.py` or `python -m unittest test_replay`.
+"""
+
+import os, unittest
+
+import mippits, replay
+
+BENCHMARKS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+INTERVAL = 1000 # instructions between checkpoints, small so that the tests cross plenty of them
+
+def load_benchmark(name): # new `Mippit` with `benchmarks/<name>.mips` loaded and its input and output set up
+    mips = mippits.Mippit()
+    with open(os.path.join(BENCHMARKS_DIRECTORY, name + ".mips"), "rb") as f: mips.load(f.read())
+    mips.input, mips.output = mippits.BytesInput(b""), mippits.BytesOutput()
+    return mips
+
+def state(mips): # everything about `mips` that going back and forth must reproduce
+    return {"registers": list(mips.registers[1:]), "HI": mips.HI, "LO": mips.LO, "PC": mips.PC, "steps": mips.steps, "memory": dict(mips.MEM.items())}
+
+def forward_states(name, steps, change_steps = None, change = None): # states of a run of `name` that never goes back, after each of `steps`, calling `change(mips)` after `change_steps` steps if given
+    mips = load_benchmark(name)
+    states = {}
+    for target in sorted(set(steps) | {change_steps} - {None}):
+        mips.run_until((), (), target - mips.steps)
+        if target == change_steps: change(mips)
+        if target in steps: states[target] = state(mips)
+    return states
+
+def add_to_sum(mips): mips.registers[3] += 12345 # change by hand to the sum `loop.mips` computes
+
+class TestReplay(unittest.TestCase):
+    def test_seek_matches_forward_run(self):
+        steps = (0, 1, 999, 1000, 1001, 4321, 7000, 9999)
+        expected = forward_states("loop", steps)
+        mips = load_benchmark("loop")
+        recording = replay.Recording(mips, INTERVAL)
+        recording.run_until(mips, max_steps=10000)
+        for target in reversed(steps):
+            with self.subTest(steps=target):
+                recording.seek(mips, target)
+                self.assertEqual(state(mips), expected[target])
+        self.assertFalse(recording.reverse_step(mips, 1)) # already at the start
+        recording.run_until(mips, max_steps=9999)
+        self.assertEqual(state(mips), expected[9999])
+
+    def test_going_back_before_change_forgets_it(self):
+        mips = load_benchmark("loop")
+        recording = replay.Recording(mips, INTERVAL)
+        recording.run_until(mips, max_steps=5000)
+        add_to_sum(mips)
+        recording.branch(mips)
+        recording.run_until(mips, max_steps=3000)
+        self.assertTrue(recording.reverse_step(mips, 6000)) # back before the change
+        recording.run_until(mips, max_steps=5000)
+        self.assertEqual(state(mips), forward_states("loop", (7000,))[7000]) # running forward again doesn't make the change
+        expected = state(mips)
+        self.assertTrue(recording.reverse_step(mips, 1)) # must not restore checkpoints taken after the change
+        recording.run_until(mips, max_steps=1)
+        self.assertEqual(state(mips), expected)
+
+    def test_going_back_after_change_keeps_it(self):
+        expected = forward_states("loop", (3000, 3500, 5000), 2500, add_to_sum)
+        mips = load_benchmark("loop")
+        recording = replay.Recording(mips, INTERVAL, max_checkpoints=4)
+        recording.run_until(mips, max_steps=2500)
+        add_to_sum(mips)
+        recording.branch(mips)
+        recording.run_until(mips, max_steps=20000) # enough checkpoints to thin them out a few times
+        self.assertLessEqual(len(recording.checkpoints), 4)
+        for target in (5000, 3500, 3000):
+            with self.subTest(steps=target):
+                recording.seek(mips, target)
+                self.assertEqual(state(mips), expected[target])
+
+    def test_output_written_once(self):
+        expected = load_benchmark("output")
+        expected.run_until((), ())
+        mips = load_benchmark("output")
+        recording = replay.Recording(mips, INTERVAL)
+        recording.run_until(mips, max_steps=30000)
+        recording.reverse_step(mips, 20000)
+        self.assertEqual(recording.run_until(mips), mippits.HALTED)
+        self.assertEqual(mips.output.device.getvalue(), expected.output.getvalue())
+
+    def test_output_after_going_back_before_change(self):
+        original = load_benchmark("output")
+        original.run_until((), ())
+        mips = load_benchmark("output")
+        recording = replay.Recording(mips, INTERVAL)
+        recording.run_until(mips, max_steps=10000)
+        before = mips.output.device.getvalue()
+        mips.registers[9] = ord("!") # end lines with "!" rather than a newline
+        recording.branch(mips)
+        recording.run_until(mips, max_steps=10000)
+        changed = mips.output.device.getvalue()[len(before):]
+        self.assertIn(b"!", changed)
+        recording.reverse_step(mips, 15000)
+        self.assertEqual(recording.run_until(mips), mippits.HALTED)
+        self.assertEqual(mips.output.device.getvalue(), before + changed + original.output.getvalue()[len(before):]) # everything after the change is written again, without the change
+
+if __name__ == "__main__":
+    unittest.main()